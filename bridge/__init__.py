@@ -40,8 +40,11 @@ DUMMY_URI = u'http://dummy.com'
 
 from bridge.filter import fetch_child, fetch_children
 from bridge.common import  XML_NS, XMLNS_NS 
+from bridge.common import atom_as_attr, atom_as_list, xmpp_bind_as_attr
 
-__all__ = ['Attribute', 'Element', 'PI', 'Comment', 'Document']
+__all__ = ['Attribute', 'Element', 'PI', 'Comment', 'Document', 'Walker',
+           'load_many', 'diff', 'patch', 'register_element_class',
+           'unregister_element_class', 'element_class']
 
 class PI(object):
     """
@@ -123,10 +126,26 @@ class Element(object):
     If `parent` is not None, `self` will be added to the `parent.xml_children` list.
     
     If `Element.as_list` is set and if (name, namespace) belongs to it
-    then we will add a list to parent with the name of the element
+    then the list of the children with that name is available as an
+    attribute of their parent named after them.
     
     If `Element.as_attribute` is set and if (name, namespace) belongs to it
-    then we will add an attribute to parent with the name of the element
+    then the first child with that name, `None` if there is none, is
+    available as an attribute of its parent named after it.
+
+    Both map a namespace to the list of the local names to expose and
+    default to the Atom and XMPP bind names of `bridge.common`:
+
+    >>> feed = Element.load(source).xml_root
+    >>> for entry in feed.entry:
+    ...     print entry.updated
+
+    Only the names listed for the namespace of the element are exposed
+    and the children are looked up within that same namespace, any other
+    name raises `AttributeError`. The children found are cached until one
+    of the methods of `Element` modifying the children is called,
+    modifying `xml_children` directly doesn't reset the cache. Misses,
+    `None` or an empty list, are not cached.
     
     :Parameters:
       - `name` -- Name of the XML element (unicode)
@@ -137,6 +156,10 @@ class Element(object):
       - `parent`: Parent element of this element.
     """
     encoding = ENCODING
+
+    as_attribute = dict(atom_as_attr)
+    as_attribute.update(xmpp_bind_as_attr)
+    as_list = dict(atom_as_list)
     
     def __init__(self, name=None, content=None, attributes=None, prefix=None, namespace=None, parent=None):
         self._root = None
@@ -151,6 +174,7 @@ class Element(object):
 
         if self.xml_parent:
             self.xml_parent.xml_children.append(self)
+            self.xml_parent.__dict__.pop('_child_cache', None)
 
         if attributes and isinstance(attributes, dict):
             for name in iter(attributes):
@@ -178,6 +202,31 @@ class Element(object):
     def __iter__(self):
         return iter(self.xml_children)
 
+    def __getattr__(self, name):
+        # only called when the regular lookup failed
+        if name.startswith('_'):
+            raise AttributeError(name)
+        values = self.__dict__
+        cache = values.get('_child_cache')
+        if cache is not None and name in cache:
+            return cache[name]
+
+        ns = values.get('xml_ns')
+        if name in self.as_list.get(ns, ()):
+            value = list(self.get_children(name, ns))
+            missing = not value
+        elif name in self.as_attribute.get(ns, ()):
+            value = self.get_child(name, ns)
+            missing = value is None
+        else:
+            raise AttributeError("'%s' element has no attribute '%s'" % (values.get('xml_name'), name))
+
+        if not missing:
+            if cache is None:
+                cache = values['_child_cache'] = {}
+            cache[name] = value
+        return value
+
     def __copy__(self):
         return Element.load(self.xml(encoding=self.encoding, omit_declaration=True))
 
@@ -235,7 +284,8 @@ class Element(object):
           - `ns`: namespace of the element
         """
         for child in self.xml_children:
-            if isinstance(child, Element) and child.xml_name == name and child.xml_ns == ns:
+            if isinstance(child, Element) and child.xml_name == name and \
+                    (child.xml_ns is ns or child.xml_ns == ns):
                 return True
 
         return False
@@ -249,7 +299,8 @@ class Element(object):
           - `ns`: namespace of the element
         """
         for child in self.xml_children:
-            if isinstance(child, Element) and child.xml_name == name and child.xml_ns == ns:
+            if isinstance(child, Element) and child.xml_name == name and \
+                    (child.xml_ns is ns or child.xml_ns == ns):
                 return child
     
     def get_children(self, name, ns=None):
@@ -261,7 +312,8 @@ class Element(object):
           - `ns`: namespace of the element
         """
         for child in self.xml_children:
-            if isinstance(child, Element) and child.xml_name == name and child.xml_ns == ns:
+            if isinstance(child, Element) and child.xml_name == name and \
+                    (child.xml_ns is ns or child.xml_ns == ns):
                 yield child
 
     def get_children_without(self, types=None):
@@ -337,6 +389,14 @@ class Element(object):
         self.xml_text = None
         self.xml_parent = None
         self.xml_children = []
+        self._invalidate()
+
+    def _invalidate(self):
+        """
+        Drops the children cached by the attribute-style accessors
+        (see `as_attribute`, `as_list` and bridge.binding).
+        """
+        self.__dict__.pop('_child_cache', None)
 
     def remove_from(self, element):
         """
@@ -344,7 +404,8 @@ class Element(object):
         """
         if self in element.xml_children:
             element.xml_children.remove(self)
-        
+            element._invalidate()
+
     def insert_before(self, before_element, element):
         """
         Inserts `element` right before `before_element`.
@@ -355,6 +416,7 @@ class Element(object):
           - `element`: new element to insert
         """
         self.xml_children.insert(self.xml_children.index(before_element), element)
+        self._invalidate()
 
     def insert_after(self, after_element, element):
         """
@@ -366,6 +428,7 @@ class Element(object):
           - `element`: new element to insert
         """
         self.xml_children.insert(self.xml_children.index(after_element) + 1, element)
+        self._invalidate()
 
     def replace(self, current_element, new_element):
         """
@@ -377,19 +440,49 @@ class Element(object):
           - `new_element`: new element to insert
         """
         self.xml_children[self.xml_children.index(current_element)] = new_element
+        self._invalidate()
 
-    def collapse(self, separator='\n'):
+    def itertext(self):
         """
-        Collapses all content of this element and its entire subtree.
+        Yields the text fragments of this element and its entire
+        subtree in document order. An element without text yields
+        an empty string so that joining the fragments gives the
+        same result as `collapse`.
         """
-        text = [self.xml_text or '']
-        for child in self.xml_children:
-            if isinstance(child, unicode) or isinstance(child, str):
-                text.append(child)
-            elif isinstance(child, Element):
-                text.append(child.collapse(separator))
+        START, NODE = Walker.START, Walker.NODE
+        for event, node in Walker(self):
+            if event == START:
+                yield node.xml_text or ''
+            elif event == NODE and isinstance(node, basestring):
+                yield node
+
+    def collapse(self, separator='\n', out=None):
+        """
+        Collapses all content of this element and its entire subtree.
 
-        return separator.join(text)
+        :Parameters:
+          - `separator`: string inserted between text fragments
+          - `out`: when provided, the text is written to this file-like
+            object in chunks rather than returned. It must accept the
+            strings of the tree, usually unicode.
+        """
+        if out is None:
+            return separator.join(self.itertext())
+
+        write = out.write
+        chunk = []
+        fragments = self.itertext()
+        for text in fragments:
+            chunk.append(text)
+            break
+        for text in fragments:
+            chunk.append(separator)
+            chunk.append(text)
+            if len(chunk) >= 1024:
+                write(''.join(chunk))
+                del chunk[:]
+        if chunk:
+            write(''.join(chunk))
 
     def is_mixed_content(self):
         """
@@ -422,29 +515,42 @@ class Element(object):
         del parser
         return result
 
-    def load(self, source, prefixes=None):
+    def load(self, source, prefixes=None, **kwargs):
         """
         Load source into an Element instance
 
         :Parameters:
           - `source`: an XML string, a file path or a file object
           - `prefixes`: dictionnary of prefixes of the form {'prefix': 'ns'}
+          - `kwargs`: options supported by the parser backend, such as
+            `lazy` or `strip_whitespace` for the default one
         """
         from bridge.parser import get_first_available_parser
         parser = get_first_available_parser()()
-        result = parser.deserialize(source, prefixes=prefixes)
+        result = parser.deserialize(source, prefixes=prefixes, **kwargs)
         del parser
         return result
     load = classmethod(load)
 
     def __update_prefixes(self, element, dst, srcns, dstns, update_attributes):
-        if update_attributes:
-            for attr in element.xml_attributes:
+        if update_attributes and element.xml_attributes:
+            # attributes are keyed by their namespace and name
+            # which may change, hence the dictionary is rebuilt
+            attributes = {}
+            for attr in element.xml_attributes.itervalues():
                 if attr.xml_ns == srcns:
                     attr.xml_prefix = dst
                     attr.xml_ns = dstns
-                elif attr.xml_ns == XMLNS_NS:
-                    attr.xml_name = dst
+                elif attr.xml_ns == XMLNS_NS and attr.xml_text == srcns:
+                    if dst:
+                        attr.xml_prefix = u'xmlns'
+                        attr.xml_name = dst
+                    else:
+                        attr.xml_prefix = None
+                        attr.xml_name = u'xmlns'
+                    attr.xml_text = dstns
+                attributes[(attr.xml_ns, attr.xml_name)] = attr
+            element.xml_attributes = attributes
 
         if element.xml_ns == srcns:
             element.xml_prefix = dst
@@ -452,10 +558,6 @@ class Element(object):
                 element.xml_ns = None
             elif not element.xml_ns:
                 element.xml_ns = dstns
-        
-        for child in element.xml_children:
-            if isinstance(child, Element):
-                self.__update_prefixes(child, dst, srcns, dstns, update_attributes)
                 
     def update_prefix(self, dst, srcns, dstns, update_attributes=True):
         """
@@ -467,7 +569,16 @@ class Element(object):
           - `dstns`: destination namespace
           - `update_attributes`: update attributes' namespace as well (default: True)
         """
-        self.__update_prefixes(self, dst, srcns, dstns, update_attributes)
+        START = Walker.START
+        for event, element in Walker(self):
+            if event == START:
+                self.__update_prefixes(element, dst, srcns, dstns, update_attributes)
+
+    def walk(self):
+        """
+        Returns a `Walker` over the subtree of this element.
+        """
+        return Walker(self)
 
     def filtrate(self, some_filter, **kwargs):
         """
@@ -501,3 +612,326 @@ class Document(Element):
 
     def __repr__(self):
         return "document at %s" % hex(id(self))
+
+class Walker(object):
+    """
+    Iterates over the subtree of an element in document order without
+    recursing, so that deep documents don't hit the recursion limit.
+    Each step is a tuple (event, node) where event is one of:
+
+      - `Walker.START`: `node` is an element whose children follow
+      - `Walker.END`: `node` is an element whose children were all visited
+      - `Walker.NODE`: `node` is a text, a comment or a processing
+        instruction
+
+    Note that the ``xml_text`` of an element is not a child and is not
+    reported on its own.
+
+    >>> walker = Walker(element)
+    >>> for event, node in walker:
+    ...     if event == Walker.START and node.xml_name == u'head':
+    ...         walker.skip()
+    ...     elif event == Walker.START and node.xml_name == u'error':
+    ...         break
+
+    Calling `skip` right after a START event skips the children of that
+    element, its END event is still reported. Breaking out of the loop
+    stops the walk.
+
+    :Parameters:
+      - `element`: root of the subtree, it is reported as well
+    """
+    START = 1
+    END = 2
+    NODE = 3
+
+    def __init__(self, element):
+        self.element = element
+        self._skip = False
+
+    def skip(self):
+        """
+        Skips the children of the element whose START event
+        was just reported.
+        """
+        self._skip = True
+
+    def __iter__(self):
+        START, END, NODE = self.START, self.END, self.NODE
+        root = self.element
+        self._skip = False
+        yield START, root
+        if self._skip:
+            self._skip = False
+            yield END, root
+            return
+
+        stack = [(root, iter(root.xml_children))]
+        while stack:
+            element, children = stack[-1]
+            for child in children:
+                if isinstance(child, Element):
+                    yield START, child
+                    if self._skip:
+                        self._skip = False
+                        yield END, child
+                    elif child.xml_children:
+                        stack.append((child, iter(child.xml_children)))
+                        break
+                    else:
+                        yield END, child
+                else:
+                    yield NODE, child
+            else:
+                stack.pop()
+                yield END, element
+
+class _materialized(object):
+    """
+    Non-data descriptor standing for a field of a `LazyElement`
+    until it gets materialized in the instance dictionary.
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        instance._materialize()
+        return instance.__dict__[self.name]
+
+class LazyElement(Element):
+    """
+    Element whose text, attributes and children are only built
+    the first time one of them is accessed. Until then the instance
+    only holds its name, prefix and namespace.
+
+    The content is built by `load`, a callable given the instance and
+    returning the tuple (text, as_cdata, attributes, children). It
+    must not access those fields on the instance and must set the
+    `xml_parent` of the attributes and children it creates rather than
+    passing `parent`. It is called once and released afterwards.
+
+    >>> def load(element):
+    ...     return u'hello', False, {}, []
+    ...
+    >>> e = LazyElement(u'greeting', load=load)
+    >>> e.xml_text
+    u'hello'
+
+    Once materialized the instance behaves exactly as a bridge.Element.
+    """
+    xml_text = _materialized('xml_text')
+    as_cdata = _materialized('as_cdata')
+    xml_attributes = _materialized('xml_attributes')
+    xml_children = _materialized('xml_children')
+
+    def __init__(self, name=None, prefix=None, namespace=None, parent=None, load=None):
+        self._root = None
+        self.xml_parent = parent
+        self.xml_prefix = prefix
+        self.xml_ns = namespace
+        self.xml_name = name
+        self._load = load
+
+    def _load_content(self):
+        load = self._load
+        if load is None:
+            raise TypeError("%s element was created without a load callable" % (self.xml_name, ))
+        self._load = None
+        return load(self)
+
+    def _materialize(self):
+        values = self.__dict__
+        text, as_cdata, attributes, children = self._load_content()
+        values.setdefault('xml_text', text)
+        values.setdefault('as_cdata', as_cdata)
+        values.setdefault('xml_attributes', attributes)
+        values.setdefault('xml_children', children)
+
+    def is_materialized(self):
+        """
+        Returns `True` once the content of this element has been built.
+        """
+        return 'xml_children' in self.__dict__
+
+_element_classes = {}
+
+def register_element_class(namespace, name, cls):
+    """
+    Registers `cls`, a subclass of `Element`, as the class of the
+    elements named `name` within `namespace` built by the parsers.
+
+    >>> from bridge.binding.atom import AtomEntry
+    >>> register_element_class(ATOM10_NS, u'entry', AtomEntry)
+
+    The class is instantiated with the same arguments as `Element`.
+    Note that lazily loaded elements are never bound.
+
+    The names exposed by `Element.as_attribute` and `Element.as_list`
+    for `namespace` keep their meaning on the instances of `cls` which
+    therefore can't define attributes named after them.
+    """
+    configured = set(cls.as_attribute.get(namespace, ()))
+    configured.update(cls.as_list.get(namespace, ()))
+    for base in cls.__mro__[:cls.__mro__.index(Element)]:
+        conflicts = configured.intersection(vars(base))
+        if conflicts:
+            raise ValueError("%s can't define %s, see Element.as_attribute and Element.as_list" % \
+                                 (cls.__name__, ', '.join(sorted(conflicts))))
+    _element_classes[(namespace, name)] = cls
+
+def unregister_element_class(namespace, name):
+    """
+    Elements named `name` within `namespace` are built
+    as plain `Element` instances again.
+    """
+    _element_classes.pop((namespace, name), None)
+
+def element_class(namespace, name):
+    """
+    Returns the class to instantiate for an element named `name`
+    within `namespace`, `Element` unless another one was registered.
+    """
+    return _element_classes.get((namespace, name), Element)
+
+def _worker_pool(workers, executor):
+    """
+    Returns a pool of `workers` processes or threads, depending on
+    `executor`, and whether the data exchanged with the workers must
+    be snapshots (see bridge.snapshot) rather than trees.
+    """
+    import multiprocessing
+    import multiprocessing.pool
+
+    if executor == 'process':
+        return multiprocessing.Pool(workers), True
+    elif executor == 'thread':
+        return multiprocessing.pool.ThreadPool(workers), False
+    raise ValueError("executor must be 'process' or 'thread'")
+
+def _portable_error(error):
+    """
+    Returns `error` or, when it can't be pickled back from a worker
+    process, an `Exception` carrying its class name and message.
+    """
+    import cPickle
+    try:
+        cPickle.dumps(error, 2)
+    except Exception:
+        error = Exception('%s: %s' % (error.__class__.__name__, error))
+    return error
+
+def _load_one(job):
+    index, source, kwargs, as_snapshot, error = job
+    try:
+        if error is not None:
+            raise error
+        document = Element.load(source, **kwargs)
+        if as_snapshot:
+            from bridge import snapshot
+            document = snapshot.dumps(document)
+        return index, document, None
+    except Exception, e:
+        if as_snapshot:
+            e = _portable_error(e)
+        return index, None, e
+
+def load_many(sources, workers=None, executor='process', ordered=True, chunksize=16, **kwargs):
+    """
+    Loads many documents concurrently and yields a tuple
+    (source, document, error) for each of them. Either `document`
+    is the loaded bridge.Document and `error` is `None`, or `document`
+    is `None` and `error` is the exception raised while loading
+    `source`. A failing source does not stop the others from
+    being loaded.
+
+    `sources` is consumed as the documents are loaded, so it may be
+    a generator of any length. Closing the returned generator before
+    its end drops the documents still queued.
+
+    >>> for source, doc, error in load_many(paths, workers=4):
+    ...     if error is None:
+    ...         index(doc)
+
+    :Parameters:
+      - `sources`: iterable of XML strings, file paths or file objects
+      - `workers`: size of the pool (default: number of CPUs)
+      - `executor`: 'process' or 'thread'. Processes send the documents
+        back as snapshots (see bridge.snapshot) which are much cheaper
+        to transfer than pickled trees. Threads are only worth it when
+        loading is dominated by I/O.
+      - `ordered`: yield the results in the order of `sources` (default)
+        rather than as soon as they are loaded
+      - `chunksize`: number of sources handed to a worker at once
+      - `kwargs`: any additional option to pass to `Element.load`
+    """
+    import multiprocessing
+    import threading
+
+    pool, as_snapshot = _worker_pool(workers, executor)
+
+    # The pool pulls jobs from a thread of its own, as fast as it can.
+    # Only a window of sources is kept in flight so that a long or
+    # endless `sources` isn't read ahead of the results being consumed.
+    # The window must hold at least a chunk or the pool would wait
+    # forever for a chunk to be complete.
+    window = threading.Semaphore(chunksize * (workers or multiprocessing.cpu_count()) * 4)
+    pending = {}
+    stopped = []
+
+    def jobs():
+        for index, source in enumerate(sources):
+            window.acquire()
+            if stopped:
+                return
+            pending[index] = source
+            data, error = source, None
+            if as_snapshot and hasattr(source, 'read'):
+                # file objects can't be sent to a process
+                try:
+                    data = source.read()
+                except Exception, e:
+                    data, error = None, _portable_error(e)
+            yield index, data, kwargs, as_snapshot, error
+
+    finished = False
+    try:
+        if ordered:
+            results = pool.imap(_load_one, jobs(), chunksize)
+        else:
+            results = pool.imap_unordered(_load_one, jobs(), chunksize)
+
+        for index, document, error in results:
+            window.release()
+            if as_snapshot and document is not None:
+                from bridge import snapshot
+                document = snapshot.loads(document)
+            yield pending.pop(index), document, error
+        finished = True
+    finally:
+        if finished:
+            pool.close()
+        else:
+            # the consumer gave up early: let jobs() return if it waits
+            # for the window and drop whatever is still queued
+            stopped.append(True)
+            window.release()
+            pool.terminate()
+        pool.join()
+
+def diff(old, new, **kwargs):
+    """
+    Returns the edit script turning the tree `old` into the tree `new`.
+    See bridge.delta for the format of the script and the options.
+    """
+    from bridge import delta
+    return delta.diff(old, new, **kwargs)
+
+def patch(tree, script):
+    """
+    Applies the edit `script` returned by `diff` to `tree`, in place,
+    and returns `tree`.
+    """
+    from bridge import delta
+    return delta.patch(tree, script)
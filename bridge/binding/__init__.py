@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Element classes bound to well-known vocabularies.
+
+Code working on bridge trees keeps looking up the same children, each
+lookup going through all the children of the element. A bound element
+class exposes those children as attributes which only scan the
+children once:
+
+>>> from bridge import Element, Attribute, register_element_class
+>>> from bridge.binding import child, text, attribute
+>>> class Link(Element):
+...     href = attribute(u'href')
+...     title = text(u'title', u'urn:links')
+...
+>>> register_element_class(u'urn:links', u'link', Link)
+>>> link = Element.load('<link xmlns="urn:links" href="/"><title>home</title></link>').xml_root
+>>> link.href, link.title
+(u'/', u'home')
+
+Once registered with `bridge.register_element_class` the class is
+instantiated by the parsers in place of `Element`. Bound elements are
+plain elements otherwise, in particular a class can't redefine the
+names `Element.as_attribute` and `Element.as_list` expose for its
+namespace.
+
+The child, or list of children, found by an accessor is cached in the
+``_child_cache`` of the element until one of the `Element` methods
+modifying the children is called. Misses, `None` or an empty list, are
+not cached since the children may not have been parsed yet. Cached
+lists are shared between the callers and must not be modified.
+"""
+__docformat__ = "restructuredtext en"
+
+__all__ = ['child', 'children', 'text', 'attribute']
+
+class child(object):
+    """
+    Accessor to the first child named `name` within `namespace`,
+    `None` if there is none.
+    """
+    def __init__(self, name, namespace=None):
+        self.name = name
+        self.namespace = namespace
+        self.key = (namespace, name)
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        cache = instance.__dict__.get('_child_cache')
+        if cache is None:
+            cache = instance.__dict__['_child_cache'] = {}
+        found = cache.get(self.key)
+        if found is None:
+            found = instance.get_child(self.name, self.namespace)
+            if found is not None:
+                cache[self.key] = found
+        return found
+
+class text(child):
+    """
+    Accessor to the text of the first child named `name`
+    within `namespace`, `None` if there is none.
+    """
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        found = child.__get__(self, instance, owner)
+        if found is not None:
+            return found.xml_text
+
+class children(object):
+    """
+    Accessor to the list of the children named `name` within
+    `namespace`.
+    """
+    def __init__(self, name, namespace=None):
+        self.name = name
+        self.namespace = namespace
+        self.key = (namespace, name, list)
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        cache = instance.__dict__.get('_child_cache')
+        if cache is None:
+            cache = instance.__dict__['_child_cache'] = {}
+        found = cache.get(self.key)
+        if found is None:
+            found = list(instance.get_children(self.name, self.namespace))
+            if found:
+                cache[self.key] = found
+        return found
+
+class attribute(object):
+    """
+    Accessor to the value of the attribute named `name`
+    within `namespace`, `None` if there is none.
+    """
+    def __init__(self, name, namespace=None):
+        self.key = (namespace, name)
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        attr = instance.xml_attributes.get(self.key)
+        if attr is not None:
+            return attr.xml_text
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Element classes of the Atom Syndication Format (RFC 4287).
+
+Nothing is registered on import, `register` makes the parsers build
+Atom documents out of them for the whole process until `unregister`
+is called:
+
+>>> from bridge.binding import atom
+>>> atom.register()
+>>> feed = Element.load(source).xml_root
+>>> for link in feed.entry[0].link:
+...     print link.rel, link.href
+
+The children of the Atom elements, such as ``entry.updated`` or
+``feed.entry``, are exposed by `Element.as_attribute` and
+`Element.as_list` whether the classes are registered or not. The
+classes only add what those can't express, such as attributes.
+"""
+__docformat__ = "restructuredtext en"
+
+from bridge import Element, register_element_class, unregister_element_class, element_class
+from bridge.common import ATOM10_NS
+from bridge.binding import attribute
+
+__all__ = ['AtomFeed', 'AtomEntry', 'AtomSource', 'AtomPerson',
+           'AtomLink', 'AtomCategory', 'register', 'unregister']
+
+class AtomPerson(Element):
+    """atom:author and atom:contributor"""
+
+class AtomLink(Element):
+    """
+    atom:link, its ``title`` attribute is read with
+    `Element.get_attribute_value` since ``link.title``
+    stands for an atom:title child (see `Element.as_attribute`)
+    """
+    href = attribute(u'href')
+    rel = attribute(u'rel')
+    type = attribute(u'type')
+    hreflang = attribute(u'hreflang')
+    length = attribute(u'length')
+
+class AtomCategory(Element):
+    """atom:category"""
+    term = attribute(u'term')
+    scheme = attribute(u'scheme')
+    label = attribute(u'label')
+
+class AtomSource(Element):
+    """atom:source"""
+
+class AtomFeed(AtomSource):
+    """atom:feed"""
+
+class AtomEntry(Element):
+    """atom:entry"""
+
+_classes = ((u'feed', AtomFeed), (u'entry', AtomEntry), (u'source', AtomSource),
+            (u'author', AtomPerson), (u'contributor', AtomPerson),
+            (u'link', AtomLink), (u'category', AtomCategory))
+
+def register():
+    """
+    Makes the parsers build the Atom elements out of
+    the classes of this module.
+    """
+    for name, cls in _classes:
+        register_element_class(ATOM10_NS, name, cls)
+
+def unregister():
+    """
+    Makes the parsers build the Atom elements as plain
+    `Element` instances again.
+    """
+    for name, cls in _classes:
+        if element_class(ATOM10_NS, name) is cls:
+            unregister_element_class(ATOM10_NS, name)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Element classes of the XMPP stanzas (RFC 3920, RFC 3921).
+
+Nothing is registered on import, `register` makes the parsers build
+the stanzas of the jabber:client namespace out of them for the whole
+process until `unregister` is called:
+
+>>> from bridge.binding import xmpp
+>>> xmpp.register()
+>>> message = Element.load(source).xml_root
+>>> message.sender, message.body
+(u'juliet@example.com/balcony', u'Wherefore art thou, Romeo?')
+"""
+__docformat__ = "restructuredtext en"
+
+from bridge import Element, register_element_class, unregister_element_class, element_class
+from bridge.common import XMPP_CLIENT_NS
+from bridge.binding import child, text, attribute
+
+__all__ = ['XmppStanza', 'XmppMessage', 'XmppPresence', 'XmppIq', 'register', 'unregister']
+
+class XmppStanza(Element):
+    """Attributes and error shared by all stanzas"""
+    id = attribute(u'id')
+    to = attribute(u'to')
+    # 'from' is a Python keyword
+    sender = attribute(u'from')
+    type = attribute(u'type')
+    error = child(u'error', XMPP_CLIENT_NS)
+
+class XmppMessage(XmppStanza):
+    """message"""
+    body = text(u'body', XMPP_CLIENT_NS)
+    subject = text(u'subject', XMPP_CLIENT_NS)
+    thread = text(u'thread', XMPP_CLIENT_NS)
+
+class XmppPresence(XmppStanza):
+    """presence"""
+    show = text(u'show', XMPP_CLIENT_NS)
+    status = text(u'status', XMPP_CLIENT_NS)
+    priority = text(u'priority', XMPP_CLIENT_NS)
+
+class XmppIq(XmppStanza):
+    """iq"""
+
+_classes = ((u'message', XmppMessage), (u'presence', XmppPresence),
+            (u'iq', XmppIq))
+
+def register():
+    """
+    Makes the parsers build the jabber:client elements out of
+    the classes of this module.
+    """
+    for name, cls in _classes:
+        register_element_class(XMPP_CLIENT_NS, name, cls)
+
+def unregister():
+    """
+    Makes the parsers build the jabber:client elements as plain
+    `Element` instances again.
+    """
+    for name, cls in _classes:
+        if element_class(XMPP_CLIENT_NS, name) is cls:
+            unregister_element_class(XMPP_CLIENT_NS, name)
@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Canonical XML serialization of bridge trees.
+
+`Element.xml` follows the order of the attributes dictionary and
+declares namespaces wherever it sees fit, two equal trees can therefore
+be serialized differently. This module implements Canonical XML 1.0
+(http://www.w3.org/TR/xml-c14n) and Exclusive XML Canonicalization
+(http://www.w3.org/TR/xml-exc-c14n) so that equal trees always produce
+the same UTF-8 bytes, which is what signing and deduplicating documents
+requires:
+
+>>> from bridge import Element
+>>> from bridge import c14n
+>>> doc = Element.load('<a xmlns="urn:a" z="1" b="2"><b/></a>')
+>>> c14n.dumps(doc)
+'<a xmlns="urn:a" b="2" z="1"><b></b></a>'
+
+The canonical form is written in chunks to any object providing either
+a ``write`` or an ``update`` method so that it can be streamed to a file
+or fed to a `hashlib` object without ever being held in memory as a
+whole:
+
+>>> import hashlib
+>>> digest = hashlib.sha1()
+>>> c14n.write(doc, digest)
+>>> digest.hexdigest() == c14n.digest(doc)
+True
+
+When serializing a subtree, exclusive canonicalization only renders the
+namespaces the subtree actually uses whereas inclusive canonicalization
+renders every namespace in scope, including those declared by its
+ancestors.
+
+Note that the namespaces of a tree built by hand are not always
+declared with ``xmlns`` attributes. The namespace and prefix of each
+element and attribute are then considered as declared where they
+are used.
+"""
+__docformat__ = "restructuredtext en"
+
+import hashlib
+from StringIO import StringIO
+
+from bridge import Element, Document, Comment, PI, Walker
+from bridge.common import XML_NS, XML_PREFIX, XMLNS_NS
+
+__all__ = ['Canonicalizer', 'write', 'dumps', 'digest',
+           'BridgeCanonicalizationException']
+
+class BridgeCanonicalizationException(StandardError):
+    def __init__(self, message=''):
+        self.message = message
+
+    def __str__(self):
+        return self.message
+
+def _escape_text(text):
+    if '&' in text:
+        text = text.replace('&', '&amp;')
+    if '<' in text:
+        text = text.replace('<', '&lt;')
+    if '>' in text:
+        text = text.replace('>', '&gt;')
+    if '\r' in text:
+        text = text.replace('\r', '&#xD;')
+    return text
+
+def _escape_attribute(value):
+    if '&' in value:
+        value = value.replace('&', '&amp;')
+    if '<' in value:
+        value = value.replace('<', '&lt;')
+    if '"' in value:
+        value = value.replace('"', '&quot;')
+    if '\t' in value:
+        value = value.replace('\t', '&#x9;')
+    if '\n' in value:
+        value = value.replace('\n', '&#xA;')
+    if '\r' in value:
+        value = value.replace('\r', '&#xD;')
+    return value
+
+def _declared(element):
+    """
+    Returns the namespaces declared, or implied, by `element`
+    as a dictionary mapping prefixes to namespaces. The default
+    namespace is mapped from the empty prefix.
+    """
+    namespaces = {}
+    for (ns, name), attr in element.xml_attributes.iteritems():
+        if ns == XMLNS_NS:
+            if attr.xml_prefix:
+                namespaces[name] = attr.xml_text or u''
+            else:
+                namespaces[u''] = attr.xml_text or u''
+        elif ns is not None and ns != XML_NS and attr.xml_prefix:
+            namespaces[attr.xml_prefix] = ns
+    namespaces[element.xml_prefix or u''] = element.xml_ns or u''
+    return namespaces
+
+class Canonicalizer(object):
+    def __init__(self, exclusive=False, with_comments=False, prefixes=None, chunk_size=1024):
+        """
+        Writes the canonical form of bridge trees.
+
+        :Parameters:
+          - `exclusive`: when ``True`` exclusive canonicalization is
+            performed, otherwise inclusive canonicalization.
+          - `with_comments`: keeps comments in the canonical form.
+          - `prefixes`: the InclusiveNamespaces PrefixList of exclusive
+            canonicalization, that is the prefixes rendered as with
+            inclusive canonicalization. Use ``'#default'`` for the
+            default namespace.
+          - `chunk_size`: number of pieces gathered before being
+            encoded and written out in one chunk.
+        """
+        self.exclusive = exclusive
+        self.with_comments = with_comments
+        self.prefixes = set()
+        for prefix in prefixes or ():
+            if prefix == '#default':
+                prefix = u''
+            self.prefixes.add(prefix)
+        self.chunk_size = chunk_size
+        self.__inherited = None
+
+    def write(self, node, out):
+        """
+        Writes the canonical form of `node` as UTF-8 encoded chunks
+        to `out`.
+
+        :Parameters:
+          - `node`: a `Document` or an `Element`, in which case only
+            the subtree it roots is canonicalized.
+          - `out`: an object providing a ``write`` method, such as a
+            file, or an ``update`` method, such as a `hashlib` object.
+        """
+        emit = getattr(out, 'write', None) or out.update
+        buffer = []
+
+        if isinstance(node, Document):
+            after_root = False
+            for child in node.xml_children:
+                if isinstance(child, Element):
+                    self.__write_element(child, {}, buffer, emit)
+                    after_root = True
+                elif isinstance(child, Comment) and self.with_comments:
+                    self.__write_misc(u'<!--%s-->' % child.data, after_root, buffer)
+                elif isinstance(child, PI):
+                    self.__write_misc(self.__pi(child), after_root, buffer)
+        else:
+            self.__write_element(node, self.__in_scope(node), buffer, emit)
+
+        if buffer:
+            emit(u''.join(buffer).encode('utf-8'))
+
+    def __write_misc(self, data, after_root, buffer):
+        # nodes outside of the document element are separated
+        # from it by a line feed
+        if after_root:
+            buffer.append(u'\n')
+            buffer.append(data)
+        else:
+            buffer.append(data)
+            buffer.append(u'\n')
+
+    def __pi(self, pi):
+        if pi.data:
+            return u'<?%s %s?>' % (pi.target, pi.data)
+        return u'<?%s?>' % (pi.target, )
+
+    def __in_scope(self, element):
+        """
+        Returns the namespaces in scope of the parent of `element`
+        as well as the xml attributes it inherits from its ancestors,
+        both required to canonicalize a subtree.
+        """
+        ancestors = []
+        parent = element.xml_parent
+        while isinstance(parent, Element) and not isinstance(parent, Document):
+            ancestors.append(parent)
+            parent = parent.xml_parent
+
+        in_scope = {}
+        inherited = {}
+        for ancestor in reversed(ancestors):
+            in_scope.update(_declared(ancestor))
+            for (ns, name), attr in ancestor.xml_attributes.iteritems():
+                if ns == XML_NS:
+                    inherited[name] = attr.xml_text
+        self.__inherited = inherited
+        return in_scope
+
+    def __start(self, element, parent_in_scope, rendered, buffer):
+        """
+        Appends the start tag of `element` to `buffer` and returns
+        its qualified name, the namespaces in scope of `element`
+        and the namespaces rendered once its start tag is written.
+        """
+        declared = _declared(element)
+        in_scope = parent_in_scope.copy()
+        in_scope.update(declared)
+
+        if self.exclusive:
+            utilized = set([element.xml_prefix or u''])
+            for (ns, name), attr in element.xml_attributes.iteritems():
+                if ns is not None and ns != XMLNS_NS and ns != XML_NS:
+                    utilized.add(attr.xml_prefix)
+            utilized.update(self.prefixes.intersection(in_scope))
+        else:
+            utilized = in_scope
+
+        namespaces = []
+        for prefix in utilized:
+            ns = in_scope[prefix]
+            if prefix == XML_PREFIX or rendered.get(prefix, u'') == ns:
+                continue
+            if not ns and prefix:
+                # undeclaring a prefix isn't allowed in XML 1.0
+                continue
+            namespaces.append((prefix, ns))
+
+        attributes = []
+        for (ns, name), attr in element.xml_attributes.iteritems():
+            if ns == XMLNS_NS:
+                continue
+            attributes.append((ns or u'', name, attr))
+        if self.__inherited:
+            # xml attributes of the ancestors of the subtree are
+            # rendered on its apex in inclusive canonicalization
+            if not self.exclusive:
+                for name, value in self.__inherited.iteritems():
+                    if (XML_NS, name) not in element.xml_attributes:
+                        attributes.append((XML_NS, name, value))
+            self.__inherited = None
+
+        if element.xml_prefix:
+            qname = u'%s:%s' % (element.xml_prefix, element.xml_name)
+        else:
+            qname = element.xml_name
+        buffer.append(u'<')
+        buffer.append(qname)
+
+        if namespaces:
+            rendered = rendered.copy()
+            namespaces.sort()
+            for prefix, ns in namespaces:
+                rendered[prefix] = ns
+                if prefix:
+                    buffer.append(u' xmlns:%s="%s"' % (prefix, _escape_attribute(ns)))
+                else:
+                    buffer.append(u' xmlns="%s"' % (_escape_attribute(ns), ))
+
+        attributes.sort()
+        for ns, name, attr in attributes:
+            if isinstance(attr, basestring):
+                value = attr
+            else:
+                value = attr.xml_text or u''
+            if ns == XML_NS:
+                name = u'xml:%s' % name
+            elif ns:
+                prefix = attr.xml_prefix
+                if not prefix or in_scope.get(prefix) != ns:
+                    raise BridgeCanonicalizationException("The namespace '%s' of attribute '%s' is not bound to a prefix" % (ns, name))
+                name = u'%s:%s' % (prefix, name)
+            buffer.append(u' %s="%s"' % (name, _escape_attribute(value)))
+        buffer.append(u'>')
+
+        return qname, in_scope, rendered
+
+    def __write_element(self, element, in_scope, buffer, emit):
+        START, END = Walker.START, Walker.END
+        chunk_size = self.chunk_size
+        with_comments = self.with_comments
+
+        # (qname, namespaces in scope, namespaces rendered) per open element
+        stack = [(None, in_scope, {})]
+        for event, node in Walker(element):
+            if event == START:
+                parent_in_scope, rendered = stack[-1][1:]
+                stack.append(self.__start(node, parent_in_scope, rendered, buffer))
+                if node.xml_text:
+                    buffer.append(_escape_text(node.xml_text))
+            elif event == END:
+                buffer.append(u'</%s>' % stack.pop()[0])
+            elif isinstance(node, basestring):
+                buffer.append(_escape_text(node))
+            elif isinstance(node, Comment):
+                if with_comments:
+                    buffer.append(u'<!--%s-->' % node.data)
+            elif isinstance(node, PI):
+                buffer.append(self.__pi(node))
+
+            if len(buffer) >= chunk_size:
+                emit(u''.join(buffer).encode('utf-8'))
+                del buffer[:]
+
+def write(node, out, exclusive=False, with_comments=False, prefixes=None):
+    """
+    Writes the canonical form of `node` to `out` which provides
+    either a ``write`` or an ``update`` method.
+
+    See `Canonicalizer` for the meaning of the other parameters.
+    """
+    Canonicalizer(exclusive, with_comments, prefixes).write(node, out)
+
+def dumps(node, exclusive=False, with_comments=False, prefixes=None):
+    """
+    Returns the canonical form of `node` as an UTF-8 encoded string.
+    """
+    out = StringIO()
+    Canonicalizer(exclusive, with_comments, prefixes).write(node, out)
+    return out.getvalue()
+
+def digest(node, algorithm='sha1', exclusive=False, with_comments=False, prefixes=None):
+    """
+    Returns the hexadecimal digest of the canonical form of `node`
+    computed with the `hashlib` `algorithm`. The canonical form is fed
+    to the digest as it is produced.
+    """
+    h = hashlib.new(algorithm)
+    Canonicalizer(exclusive, with_comments, prefixes).write(node, h)
+    return h.hexdigest()
@@ -4,6 +4,7 @@
 __all__ = []
 
 ANY_NAMESPACE = 1
+ANY_NAME = 2
 
 XML_NS = u'http://www.w3.org/XML/1998/namespace'
 XML_PREFIX = u'xml'
@@ -25,6 +26,13 @@ ATOM10_NS = u'http://www.w3.org/2005/Atom'
 ATOMPUB_NS = u'http://www.w3.org/2007/app'
 THR_NS = u'http://purl.org/syndication/thread/1.0'
 
+# children exposed as attributes of their parent, see Element.as_attribute
+atom_as_attr = {ATOM10_NS: ['id', 'title', 'subtitle', 'updated', 'published',
+                            'summary', 'content', 'rights', 'source', 'generator',
+                            'icon', 'logo', 'name', 'uri', 'email']}
+# children exposed as lists, see Element.as_list
+atom_as_list = {ATOM10_NS: ['entry', 'link', 'category', 'author', 'contributor']}
+
 ###########################################################
 # Dublin Core
 ###########################################################
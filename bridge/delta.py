@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Differences between two versions of a bridge tree.
+
+`diff` computes the edit script turning a tree into another one and
+`patch` applies it, so that only what changed between two versions of
+a document needs to be sent:
+
+>>> from bridge import Element, diff, patch
+>>> old = Element.load('<feed><entry>a</entry></feed>')
+>>> new = Element.load('<feed><entry>b</entry><entry>c</entry></feed>')
+>>> script = diff(old, new)
+>>> patch(old, script).xml() == new.xml()
+True
+
+The script is a list of operations, plain tuples which can be pickled
+or otherwise serialized:
+
+  - ``(DELETE, path)`` removes the node at `path`
+  - ``(INSERT, path, payload)`` inserts the node carried by `payload`
+    at `path`. Elements are carried as snapshots (see bridge.snapshot),
+    texts as unicode strings, comments and processing instructions as
+    detached copies.
+  - ``(UPDATE_TEXT, path, text)`` sets the text of the element at `path`
+  - ``(UPDATE_ATTRIBUTE, path, (ns, name), prefix, value)`` sets an
+    attribute of the element at `path`, or removes it when `value`
+    is `None`.
+
+A path is the tuple of the indices in ``xml_children`` leading from the
+root of the tree to a node. It refers to the tree as it is when the
+operation is applied, operations must therefore be applied in order.
+
+Children are matched by a key: their name and the value returned by the
+`key` function, `atom:id` by default, or their position among their
+siblings of the same name. Matched children kept in the same relative
+order are diffed recursively, the others are deleted and inserted.
+Subtrees with the same content hash (see bridge.filter.content_hash)
+are skipped altogether which keeps the cost close to linear.
+"""
+__docformat__ = "restructuredtext en"
+
+from bisect import bisect_left
+
+from bridge import Element, Attribute, Comment, PI
+from bridge import snapshot
+from bridge.common import ATOM10_NS
+from bridge.filter import content_hash
+
+__all__ = ['diff', 'patch', 'atom_id', 'DELETE', 'INSERT',
+           'UPDATE_TEXT', 'UPDATE_ATTRIBUTE', 'BridgeDeltaException']
+
+DELETE = 'delete'
+INSERT = 'insert'
+UPDATE_TEXT = 'text'
+UPDATE_ATTRIBUTE = 'attribute'
+
+class BridgeDeltaException(StandardError):
+    def __init__(self, message=''):
+        self.message = message
+
+    def __str__(self):
+        return self.message
+
+def atom_id(element):
+    """
+    Returns the value of the `atom:id` child of `element`, `None`
+    if it has none.
+    """
+    for child in element.xml_children:
+        if isinstance(child, Element) and child.xml_name == u'id' and \
+                (child.xml_ns is ATOM10_NS or child.xml_ns == ATOM10_NS):
+            return child.xml_text
+    return None
+
+def _keys(children, key):
+    """
+    Returns the list of the keys identifying `children`. Nodes sharing
+    the same identity are told apart by their occurrence number.
+    """
+    keys = []
+    occurrences = {}
+    for child in children:
+        if isinstance(child, Element):
+            identity = (child.xml_ns, child.xml_name, child.xml_prefix, key(child))
+        elif isinstance(child, basestring):
+            identity = (u'#text', child)
+        elif isinstance(child, Comment):
+            identity = (u'#comment', child.data)
+        elif isinstance(child, PI):
+            identity = (u'#pi', child.target, child.data)
+        else:
+            identity = (u'#node', id(child))
+        occurrence = occurrences.get(identity, 0)
+        occurrences[identity] = occurrence + 1
+        keys.append((identity, occurrence))
+    return keys
+
+def _longest_increasing(sequence):
+    """
+    Returns the set of the values making up the longest increasing
+    subsequence of `sequence`, in O(n log n).
+    """
+    tails = []
+    tail_indices = []
+    previous = [None] * len(sequence)
+    for i, value in enumerate(sequence):
+        position = bisect_left(tails, value)
+        if position == len(tails):
+            tails.append(value)
+            tail_indices.append(i)
+        else:
+            tails[position] = value
+            tail_indices[position] = i
+        if position:
+            previous[i] = tail_indices[position - 1]
+
+    kept = set()
+    i = None
+    if tail_indices:
+        i = tail_indices[-1]
+    while i is not None:
+        kept.add(sequence[i])
+        i = previous[i]
+    return kept
+
+def _payload(node):
+    # snapshots are byte strings, texts are therefore
+    # always carried as unicode to tell them apart
+    if isinstance(node, Element):
+        return snapshot.dumps(node)
+    if isinstance(node, str):
+        return node.decode('utf-8')
+    # detached copies so that the script neither shares nodes
+    # with `new` nor drags the whole tree along when pickled
+    if isinstance(node, Comment):
+        return Comment(node.data)
+    if isinstance(node, PI):
+        return PI(node.target, node.data)
+    return node
+
+def _diff_element(old, new, path, script):
+    if old.xml_text != new.xml_text:
+        script.append((UPDATE_TEXT, path, new.xml_text))
+
+    old_attributes = old.xml_attributes
+    new_attributes = new.xml_attributes
+    for qname, attr in new_attributes.iteritems():
+        old_attr = old_attributes.get(qname)
+        if old_attr is None or old_attr.xml_text != attr.xml_text or \
+                old_attr.xml_prefix != attr.xml_prefix:
+            script.append((UPDATE_ATTRIBUTE, path, qname, attr.xml_prefix, attr.xml_text))
+    for qname in old_attributes:
+        if qname not in new_attributes:
+            script.append((UPDATE_ATTRIBUTE, path, qname, None, None))
+
+def diff(old, new, key=atom_id):
+    """
+    Returns the edit script turning the tree `old` into the tree `new`.
+
+    :Parameters:
+      - `old`: a bridge.Document or a bridge.Element
+      - `new`: a bridge.Document or a bridge.Element, with the same
+        name and namespace as `old` if an element
+      - `key`: callable returning a value identifying an element among
+        its siblings, or `None` if it has none
+    """
+    if (old.xml_ns, old.xml_name, old.xml_prefix) != (new.xml_ns, new.xml_name, new.xml_prefix):
+        raise BridgeDeltaException("Cannot diff %s against %s" % (old.xml_name, new.xml_name))
+
+    old_hashes = {}
+    new_hashes = {}
+    content_hash(old, old_hashes)
+    content_hash(new, new_hashes)
+
+    script = []
+    # pairs of matched elements left to diff
+    pending = [(old, new, ())]
+    while pending:
+        old_element, new_element, path = pending.pop()
+        if old_hashes[id(old_element)] == new_hashes[id(new_element)]:
+            continue
+
+        _diff_element(old_element, new_element, path, script)
+
+        old_children = old_element.xml_children
+        new_children = new_element.xml_children
+        old_indices = dict((k, i) for i, k in enumerate(_keys(old_children, key)))
+        matches = []
+        for j, k in enumerate(_keys(new_children, key)):
+            i = old_indices.get(k)
+            if i is not None:
+                matches.append((i, j))
+
+        # matched children which don't keep their relative
+        # order are moved by deleting and inserting them
+        kept = _longest_increasing([i for i, j in matches])
+        old_kept = {}
+        new_kept = {}
+        for i, j in matches:
+            if i in kept:
+                old_kept[i] = j
+                new_kept[j] = i
+
+        for i in xrange(len(old_children) - 1, -1, -1):
+            if i not in old_kept:
+                script.append((DELETE, path + (i, )))
+        for j, child in enumerate(new_children):
+            if j not in new_kept:
+                script.append((INSERT, path + (j, ), _payload(child)))
+
+        for j in xrange(len(new_children) - 1, -1, -1):
+            if j in new_kept:
+                child = new_children[j]
+                if isinstance(child, Element):
+                    pending.append((old_children[new_kept[j]], child, path + (j, )))
+
+    return script
+
+def _resolve(tree, path):
+    node = tree
+    for index in path:
+        node = node.xml_children[index]
+    return node
+
+def patch(tree, script):
+    """
+    Applies the edit `script` returned by `diff` to `tree`, in place,
+    and returns `tree`.
+
+    :Parameters:
+      - `tree`: a bridge.Document or a bridge.Element matching the
+        `old` tree the script was computed from
+      - `script`: list of operations
+    """
+    for operation in script:
+        kind, path = operation[0], operation[1]
+        if kind == DELETE:
+            parent = _resolve(tree, path[:-1])
+            node = parent.xml_children.pop(path[-1])
+            parent._invalidate()
+            if not isinstance(node, basestring):
+                node.xml_parent = None
+        elif kind == INSERT:
+            parent = _resolve(tree, path[:-1])
+            node = operation[2]
+            if isinstance(node, str):
+                node = snapshot.loads(node)
+            elif isinstance(node, Comment):
+                node = Comment(node.data)
+            elif isinstance(node, PI):
+                node = PI(node.target, node.data)
+            if not isinstance(node, basestring):
+                node.xml_parent = parent
+            parent.xml_children.insert(path[-1], node)
+            parent._invalidate()
+        elif kind == UPDATE_TEXT:
+            _resolve(tree, path).xml_text = operation[2]
+        elif kind == UPDATE_ATTRIBUTE:
+            element = _resolve(tree, path)
+            qname, prefix, value = operation[2:]
+            if value is None:
+                element.xml_attributes.pop(qname, None)
+            else:
+                ns, name = qname
+                Attribute(name, value, prefix, ns, element)
+        else:
+            raise BridgeDeltaException("Unknown operation %r" % (kind, ))
+
+    return tree
@@ -4,12 +4,16 @@ __docformat__ = "restructuredtext en"
 
 __all__ = ['remove_duplicate_namespaces_declaration',
            'remove_useless_namespaces_decalaration',
-           'fetch_child', 'fetch_children', 'element_children', 'lookup']
+           'fetch_child', 'fetch_children', 'element_children', 'lookup',
+           'stream_lookup', 'content_hash', 'dedupe_subtrees',
+           'interested_in', 'Pipeline']
 
+import hashlib
+import os.path
 import re
 
 import bridge
-from bridge.common import XMLNS_NS
+from bridge.common import XMLNS_NS, ANY_NAMESPACE, ANY_NAME
 
 def fetch_child(element, child_name, child_ns):
     """
@@ -27,7 +31,7 @@ def fetch_child(element, child_name, child_ns):
     """
     for child in element.xml_children:
         if isinstance(child, bridge.Element):
-            if child.xml_ns == child_ns:
+            if child.xml_ns is child_ns or child.xml_ns == child_ns:
                 if child.xml_name == child_name:
                     return child
 
@@ -51,7 +55,7 @@ def fetch_children(element, child_name, child_ns, recursive=False):
     element_type = type(element)
     for child in element.xml_children:
         if isinstance(child, element_type):
-            if child.xml_ns == child_ns:
+            if child.xml_ns is child_ns or child.xml_ns == child_ns:
                 if child.xml_name == child_name:
                     children.append(child)
             if recursive:
@@ -88,20 +92,22 @@ def remove_duplicate_namespaces_declaration(element, visited_ns=None):
       - `element`: root element to start from
       - `visited_ns`: list of already visited namespace
     """
-    if visited_ns is None:
-        visited_ns = []
-    _visited_ns = visited_ns[:]
-    attrs = element.xml_attributes[:]
-    for attr in attrs:
-        if attr.xml_ns == XMLNS_NS:
-            if attr.xml_text in visited_ns:
-                element.xml_attributes.remove(attr)
-            else:
-                _visited_ns.append(attr.xml_text)
-    attrs = None
-    for child in element_children(element):
-        remove_duplicate_namespaces_declaration(child, _visited_ns)
-    _visited_ns = None
+    START, END = bridge.Walker.START, bridge.Walker.END
+    # namespaces declared by each open element and its ancestors
+    stack = [visited_ns or []]
+    for event, node in bridge.Walker(element):
+        if event == START:
+            visited = stack[-1]
+            _visited_ns = visited[:]
+            for qname, attr in node.xml_attributes.items():
+                if attr.xml_ns == XMLNS_NS:
+                    if attr.xml_text in visited:
+                        del node.xml_attributes[qname]
+                    else:
+                        _visited_ns.append(attr.xml_text)
+            stack.append(_visited_ns)
+        elif event == END:
+            stack.pop()
 
 def find_by_id(element, id):
     """
@@ -220,8 +226,7 @@ def lookup(element, path):
         child = start_at.get_child(local_name, ns=uri)
         if child:
             if attr_name:
-                attr = child.get_attribute(attr_name)
-                if attr and attr.xml_text == attr_value:
+                if child.get_attribute_value(attr_name) == attr_value:
                     found_match = start_at = child
                 else:
                     found_match = None
@@ -233,8 +238,369 @@ def lookup(element, path):
             break
 
     return found_match
+
+class _LookupDone(Exception):
+    pass
+
+def _lookup_handler(tokens):
+    from bridge.parser.bridge_default import IncrementalHandler
+
+    class LookupHandler(IncrementalHandler):
+        """
+        Only builds the chain of elements matching the tokens of the path
+        and the subtree of the last one. Raises `_LookupDone` as soon as
+        the outcome of the lookup is known.
+        """
+        def __init__(self):
+            IncrementalHandler.__init__(self)
+            self.match = None
+            self._depth = 0
+            self._skip_depth = None
+            self._match_depth = None
+
+        def startElementNS(self, name, qname, attrs):
+            depth = self._depth
+            self._depth = depth + 1
+            if self._match_depth is None:
+                if self._skip_depth is not None:
+                    return
+                uri, local_name, attr_name, attr_value = tokens[depth]
+                if name != (uri, local_name):
+                    self._skip_depth = depth
+                    return
+                # like lookup, only the first child with the expected
+                # name is considered, the search fails if its attribute
+                # doesn't match or if it closes without a match
+                if attr_name and attrs.get((None, attr_name)) != attr_value:
+                    raise _LookupDone()
+                if depth == len(tokens) - 1:
+                    self._match_depth = depth
+            IncrementalHandler.startElementNS(self, name, qname, attrs)
+
+        def endElementNS(self, name, qname):
+            self._depth = depth = self._depth - 1
+            if self._match_depth is not None:
+                if depth == self._match_depth:
+                    if self._text:
+                        self._flush_text()
+                    self.match = self._current_el
+                    raise _LookupDone()
+                IncrementalHandler.endElementNS(self, name, qname)
+            elif self._skip_depth is not None:
+                if depth == self._skip_depth:
+                    self._skip_depth = None
+            else:
+                raise _LookupDone()
+
+        def characters(self, content):
+            if self._match_depth is not None:
+                IncrementalHandler.characters(self, content)
+
+        def comment(self, data):
+            if self._match_depth is not None:
+                IncrementalHandler.comment(self, data)
+
+        def processingInstruction(self, target, data):
+            if self._match_depth is not None:
+                IncrementalHandler.processingInstruction(self, target, data)
+
+    return LookupHandler()
+
+def stream_lookup(source, path, chunk_size=65536):
+    """
+    Same as `lookup` but evaluates `path` while parsing `source`
+    rather than on a loaded document.
+
+    >>> from bridge.filter import stream_lookup
+    >>> stream_lookup('archive.xml', u'/{http://www.w3.org/2005/Atom}feed/{http://www.w3.org/2005/Atom}title')
+    <title element at 0xb7c0c30cL />
+
+    Reading stops as soon as the matching element is complete or as
+    soon as it is known that there will be no match. Only the matching
+    element, with its whole subtree, and its ancestors are built, the
+    ancestors being stripped of their other children.
+
+    The path is always evaluated from the document, a relative path
+    is therefore equivalent to the same path starting with '/'.
+
+    :Parameters:
+      - `source`: file path, file object or XML string
+      - `path`: see `lookup`
+      - `chunk_size`: number of bytes read and parsed at once
+    """
+    import xml.sax as xs
+    import xml.sax.handler as xsh
+
+    tokens = list(next_token(path))
+    handler = _lookup_handler(tokens)
+    parser = xs.make_parser()
+    parser.setFeature(xsh.feature_namespaces, True)
+    parser.setContentHandler(handler)
+    parser.setProperty(xsh.property_lexical_handler, handler)
+
+    close_source = False
+    if isinstance(source, basestring):
+        if os.path.exists(source):
+            source = open(source, 'rb')
+            close_source = True
+        elif isinstance(source, unicode):
+            source = source.encode(bridge.ENCODING)
+
+    try:
+        try:
+            if isinstance(source, basestring):
+                for start in xrange(0, len(source), chunk_size):
+                    parser.feed(source[start:start + chunk_size])
+            else:
+                while 1:
+                    chunk = source.read(chunk_size)
+                    if not chunk:
+                        break
+                    parser.feed(chunk)
+            parser.close()
+        except _LookupDone:
+            pass
+    finally:
+        if close_source:
+            source.close()
+
+    return handler.match
     
 
+def _node_hash(element, cache):
+    h = hashlib.sha1()
+    parts = [u'E', element.xml_name or u'', element.xml_ns or u'',
+             element.xml_prefix or u'', element.as_cdata and u'C' or u'']
+    for key in sorted(element.xml_attributes):
+        attr = element.xml_attributes[key]
+        parts.extend((u'A', attr.xml_ns or u'', attr.xml_name or u'',
+                      attr.xml_prefix or u'', attr.xml_text or u''))
+    if element.xml_text:
+        parts.extend((u'T', element.xml_text))
+    h.update(u'\x00'.join(parts).encode('utf-8'))
+
+    # a NUL character can't be part of an XML document so it
+    # safely separates the pieces making up the node
+    for child in element.xml_children:
+        if isinstance(child, basestring):
+            h.update('\x00T\x00')
+            if isinstance(child, unicode):
+                child = child.encode('utf-8')
+            h.update(child)
+        elif isinstance(child, bridge.Element):
+            h.update('\x00E')
+            h.update(cache[id(child)])
+        elif isinstance(child, bridge.Comment):
+            h.update('\x00!\x00')
+            h.update(child.data.encode('utf-8'))
+        elif isinstance(child, bridge.PI):
+            h.update('\x00?\x00')
+            h.update((u'%s\x00%s' % (child.target, child.data or u'')).encode('utf-8'))
+    return h.digest()
+
+def content_hash(element, cache=None):
+    """
+    Returns the SHA-1 digest of the content of the subtree rooted at
+    `element`: names, namespaces, prefixes, attributes, texts, comments
+    and processing instructions. Two subtrees with the same digest
+    serialize the same way.
+
+    The digest of a node is computed from the digests of its children
+    so the whole subtree is hashed in one bottom-up pass. The digest of
+    every element met is stored in `cache`, keyed by the `id` of the
+    element, so that once a tree has been hashed any two of its
+    subtrees can be compared in constant time:
+
+    >>> cache = {}
+    >>> digest = content_hash(doc, cache)
+    >>> cache[id(entry1.get_child('author', ATOM10_NS))] == cache[id(entry2.get_child('author', ATOM10_NS))]
+    True
+
+    Note that digests are not updated when the tree is modified and
+    that the cache must not outlive the elements it refers to as their
+    `id` could be reused.
+
+    :Parameters:
+      - `element`: root element of the subtree to hash
+      - `cache`: dictionary the digests are stored into
+    """
+    if cache is None:
+        cache = {}
+    if id(element) in cache:
+        return cache[id(element)]
+
+    # an element is hashed once all its children are
+    START, END = bridge.Walker.START, bridge.Walker.END
+    walker = bridge.Walker(element)
+    for event, node in walker:
+        if event == START:
+            if id(node) in cache:
+                walker.skip()
+        elif event == END and id(node) not in cache:
+            cache[id(node)] = _node_hash(node, cache)
+
+    return cache[id(element)]
+
+def dedupe_subtrees(document, cache=None):
+    """
+    Shares identical subtrees of `document`: every subtree with the
+    same content as one met before it in document order is replaced
+    by the latter in its parent children. Equal texts end up sharing
+    the same string as well. This cuts the memory held by documents
+    repeating the same blocks, such as authors or categories in an
+    aggregated feed.
+
+    Returns the number of subtrees which were replaced.
+
+    A shared subtree has several parents but its ``xml_parent`` only
+    refers to the parent of its first occurrence. The document must
+    therefore be considered as read-only once deduplicated.
+
+    :Parameters:
+      - `document`: element to deduplicate
+      - `cache`: dictionary of digests as filled by `content_hash`.
+        The entries of the replaced subtrees are removed from it.
+    """
+    if cache is None:
+        cache = {}
+    content_hash(document, cache)
+
+    START, END = bridge.Walker.START, bridge.Walker.END
+    shared = {}
+    texts = {}
+    dropped = []
+    # [element, index of its next child] per open element
+    positions = []
+    walker = bridge.Walker(document)
+    for event, node in walker:
+        if event == START:
+            if positions:
+                parent = positions[-1]
+                index = parent[1]
+                parent[1] = index + 1
+                original = shared.setdefault(cache[id(node)], node)
+                if original is not node:
+                    parent[0].xml_children[index] = original
+                    parent[0]._invalidate()
+                    dropped.append(node)
+                    walker.skip()
+                elif node.xml_text:
+                    node.xml_text = texts.setdefault(node.xml_text, node.xml_text)
+            elif node.xml_text:
+                node.xml_text = texts.setdefault(node.xml_text, node.xml_text)
+            positions.append([node, 0])
+        elif event == END:
+            positions.pop()
+        else:
+            parent = positions[-1]
+            if isinstance(node, basestring):
+                parent[0].xml_children[parent[1]] = texts.setdefault(node, node)
+            parent[1] = parent[1] + 1
+
+    replaced = len(dropped)
+    while dropped:
+        element = dropped.pop()
+        cache.pop(id(element), None)
+        dropped.extend(element_children(element))
+
+    return replaced
+
+def interested_in(*names):
+    """
+    Decorator declaring the elements a filter applies to so that a
+    `Pipeline` only calls it on those. Each name is either a
+    ``(namespace, local_name)`` tuple, where ``ANY_NAMESPACE`` and
+    ``ANY_NAME`` are supported, or a local name within any namespace.
+
+    >>> @interested_in((ATOM10_NS, u'entry'))
+    ... def is_draft(element):
+    ...     return element.get_child(u'control', ATOMPUB_NS) is not None
+
+    The filter is returned unchanged and can still be applied on its
+    own with `Element.filtrate`.
+    """
+    interests = []
+    for name in names:
+        if isinstance(name, basestring):
+            name = (ANY_NAMESPACE, name)
+        interests.append(name)
+
+    def decorate(some_filter):
+        some_filter.interests = tuple(interests)
+        return some_filter
+    return decorate
+
+class Pipeline(object):
+    """
+    Applies several filters to the elements of a tree in a single
+    traversal rather than one traversal per filter.
+
+    >>> pipeline = Pipeline(requires_summary, requires_author)
+    >>> pipeline.add(lookup_links, rel=u'alternate')
+    >>> summaries, authors, links = feed.filtrate(pipeline)
+
+    Each filter is called, with the keyword arguments it was added
+    with, on every element of the tree it is interested in (see
+    `interested_in`), every element if it didn't say. The filters
+    interested in a given element name are resolved once and cached.
+
+    Running the pipeline returns one list per filter, in the order
+    they were added, of (element, result) tuples in document order.
+    """
+    def __init__(self, *filters):
+        from bridge.parser.bridge_default import DispatchTable
+        self.filters = []
+        self._table = DispatchTable()
+        self._resolved = {}
+        for some_filter in filters:
+            self.add(some_filter)
+
+    def add(self, some_filter, **kwargs):
+        """
+        Adds `some_filter` to the pipeline, it will be called
+        with `kwargs` on top of the element.
+        """
+        index = len(self.filters)
+        self.filters.append((some_filter, kwargs))
+        interests = getattr(some_filter, 'interests', None) or ((ANY_NAMESPACE, ANY_NAME), )
+        for key in interests:
+            self._table.add(key, index)
+        self._resolved.clear()
+        return self
+
+    def __resolve(self, key):
+        indices = []
+        for index in self._table.lookup(*key):
+            if index not in indices:
+                indices.append(index)
+        indices.sort()
+        indices = self._resolved[key] = tuple(indices)
+        return indices
+
+    def run(self, element):
+        """
+        Applies the filters to `element` and its whole subtree.
+        """
+        filters = self.filters
+        results = [[] for some_filter in filters]
+        resolved = self._resolved
+        START = bridge.Walker.START
+        for event, node in bridge.Walker(element):
+            if event != START:
+                continue
+            key = (node.xml_ns, node.xml_name)
+            indices = resolved.get(key)
+            if indices is None:
+                indices = self.__resolve(key)
+            for index in indices:
+                some_filter, kwargs = filters[index]
+                results[index].append((node, some_filter(element=node, **kwargs)))
+
+        return results
+
+    def __call__(self, element):
+        return self.run(element)
+
 ###################################################################
 # For generator consumers
 ###################################################################
@@ -6,6 +6,7 @@ from bridge.common import ATOM10_NS, ATOMPUB_NS, THR_NS, XHTML1_NS
 
 import datetime
 from bridge.lib import isodate
+from bridge.filter import interested_in
 
 __all__ = ['published_after', 'updated_after',
            'published_before', 'updated_before',
@@ -33,24 +34,25 @@ def _is_after_date(node, dt_pivot, strict=True):
 
 def _cmp_date(func, name, element, dt_pivot, strict=True, recursive=False, include_feed=True):
     elements = []
-    if element.name == u'feed' and element.xmlns == ATOM10_NS:
+    if element.xml_name == u'feed' and element.xml_ns == ATOM10_NS:
         if include_feed:
-            if element.has_element(name, ATOM10_NS):
-                if func(element.published, dt_pivot, strict):
+            if element.has_child(name, ATOM10_NS):
+                if func(getattr(element, name), dt_pivot, strict):
                     elements.append(element)
             
         if recursive:
             for entry in element.entry:
-                if entry.has_element(name, ATOM10_NS):
-                    if func(entry.published, dt_pivot, strict):
+                if entry.has_child(name, ATOM10_NS):
+                    if func(getattr(entry, name), dt_pivot, strict):
                         elements.append(entry)        
-    elif element.name == u'entry' and element.xmlns == ATOM10_NS:
-        if element.has_element(name, ATOM10_NS):
-            if func(element.published, dt_pivot, strict):
+    elif element.xml_name == u'entry' and element.xml_ns == ATOM10_NS:
+        if element.has_child(name, ATOM10_NS):
+            if func(getattr(element, name), dt_pivot, strict):
                 elements.append(element) 
                 
     return elements
 
+@interested_in((ATOM10_NS, u'feed'), (ATOM10_NS, u'entry'))
 def published_after(element, dt_pivot, strict=True, recursive=False, include_feed=True):
     """
     Returns the list of elements which have been published after the given date.
@@ -65,6 +67,7 @@ def published_after(element, dt_pivot, strict=True, recursive=False, include_fee
     return _cmp_date(_is_after_date, 'published', element, dt_pivot,
                      strict, recursive, include_feed)
 
+@interested_in((ATOM10_NS, u'feed'), (ATOM10_NS, u'entry'))
 def updated_after(element, dt_pivot, strict=True, recursive=False, include_feed=True):
     """
     Returns the list of elements which have been updated  after the given date.
@@ -79,6 +82,7 @@ def updated_after(element, dt_pivot, strict=True, recursive=False, include_feed=
     return _cmp_date(_is_after_date, 'updated', element, dt_pivot,
                      strict, recursive, include_feed)
 
+@interested_in((ATOM10_NS, u'feed'), (ATOM10_NS, u'entry'))
 def published_before(element, dt_pivot, strict=True, recursive=False, include_feed=True):
     """
     Returns the list of elements which have been published before the given date.
@@ -94,6 +98,7 @@ def published_before(element, dt_pivot, strict=True, recursive=False, include_fe
     return _cmp_date(_is_before_date, 'published', element, dt_pivot,
                      strict, recursive, include_feed)
 
+@interested_in((ATOM10_NS, u'feed'), (ATOM10_NS, u'entry'))
 def updated_before(element, dt_pivot, strict=True, recursive=False, include_feed=True):
     """
     Returns the list of elements which have been updated before the given date.
@@ -110,6 +115,7 @@ def updated_before(element, dt_pivot, strict=True, recursive=False, include_feed
                      strict, recursive, include_feed)
 
 
+@interested_in((ATOM10_NS, u'feed'))
 def lookup_entry(element, id):
     """
     Returns the first entry matching the id provided in parameter
@@ -123,6 +129,7 @@ def lookup_entry(element, id):
                 
     return None
 
+@interested_in((ATOM10_NS, u'feed'), (ATOM10_NS, u'entry'))
 def lookup_links(element, **kwargs):
     """
     Returns a list of links matching the attributes passed as parameters.
@@ -136,10 +143,10 @@ def lookup_links(element, **kwargs):
         for link in links:
             candidate = False
             for arg in kwargs:
-                attr = link.get_attribute(arg)
-                if attr:
+                attr = link.get_attribute_value(arg)
+                if attr is not None:
                     value = kwargs.get(arg)
-                    if value == attr.xml_text:
+                    if value == attr:
                         candidate = True
                     else:
                         candidate = False
@@ -153,6 +160,7 @@ def lookup_links(element, **kwargs):
                 
     return results
 
+@interested_in((ATOM10_NS, u'entry'))
 def requires_summary(element):
     """
     Returns True if the entry requires an atom:summary
@@ -169,13 +177,12 @@ def requires_summary(element):
     #     and does not end with "/xml" or "+xml".
     needs_summary = False
     content = element.get_child('content', ATOM10_NS)
-    if content:
-        src = content.get_attribute_ns('src', ATOM10_NS)
-        mime_type = content.get_attribute_ns('type', ATOM10_NS)
+    if content is not None:
+        src = content.get_attribute_value('src')
+        mime_type = content.get_attribute_value('type')
         if src:
             needs_summary = True
-        elif mime_type:
-            mime_type = mime_type.xml_text
+        elif mime_type and mime_type not in (u'text', u'html', u'xhtml'):
             if mime_type not in _xml_media_types:
                 needs_summary = True
             if mime_type.startswith("text/"):
@@ -186,6 +193,7 @@ def requires_summary(element):
         needs_summary = True
     return needs_summary
 
+@interested_in((ATOM10_NS, u'entry'))
 def requires_author(element):
     """
     Returns True if the entry requires an atom:author
@@ -200,21 +208,22 @@ def requires_author(element):
     # the atom:feed element contains an atom:author element itself.
     needs_author = False
     author = element.get_child('author', ATOM10_NS)
-    if not author:
+    if author is None:
         needs_author = True
         source = element.get_child('source', ATOM10_NS)
-        if source:
+        if source is not None:
             author = source.get_child('author', ATOM10_NS)
-            if author:
+            if author is not None:
                 needs_author = False
         if element.xml_parent and element.xml_parent.xml_name == 'feed' and \
            element.xml_parent.xml_prefix == element.xml_prefix and \
            element.xml_parent.xml_ns == ATOM10_NS:
             author = element.xml_parent.get_child('author', ATOM10_NS)
-            if author:
+            if author is not None:
                needs_author = False
     return needs_author
 
+@interested_in((ATOM10_NS, u'feed'), (ATOM10_NS, u'entry'))
 def valid_categories(element, test_set, matching=None):
 
     # The app:categories element can contain a "fixed" attribute, with a
@@ -225,17 +234,17 @@ def valid_categories(element, test_set, matching=None):
     # open SHOULD NOT reject otherwise acceptable members whose categories
     # are not listed in the Collection.
     
-    categories = element.get_children('category', ATOM10_NS)
+    categories = list(element.get_children('category', ATOM10_NS))
     if not matching:
         matching = ['term']
     for candidate in test_set:
         valid = False
         for current in categories:
             for token in matching:
-                current_attr = current.get_attribute(token)
-                if current_attr:
-                    candidate_attr = candidate.get_attribute(token)
-                    if current_attr.xml_text == candidate_attr.xml_text:
+                current_attr = current.get_attribute_value(token)
+                if current_attr is not None:
+                    candidate_attr = candidate.get_attribute_value(token)
+                    if current_attr == candidate_attr:
                         valid = True
                     else:
                         valid = False
@@ -249,6 +258,7 @@ def valid_categories(element, test_set, matching=None):
     return valid
 
 
+@interested_in((ATOM10_NS, u'feed'), (ATOM10_NS, u'entry'), (ATOM10_NS, u'source'))
 def fetch_empty_authors(element, matching=None):
     """
     Return a list of atom:author elements which have an empty text for the
@@ -6,9 +6,11 @@ from bridge.common import XHTML1_NS, XHTML1_PREFIX
 
 import datetime
 from bridge.lib import isodate
+from bridge.filter import interested_in
 
 __all__ = ['extract_meta']
 
+@interested_in((XHTML1_NS, u'head'))
 def extract_meta(element):
     """
     Extracts meta elements from an XHTML document and return them
@@ -20,8 +22,8 @@ def extract_meta(element):
     metas = element.get_children('meta', XHTML1_NS)
     result = {}
     for meta in metas:
-        name = meta.get_attribute('name').xml_text
-        content = meta.get_attribute('content').xml_text
+        name = meta.get_attribute_value('name')
+        content = meta.get_attribute_value('content')
         result[name] = content
 
     return result
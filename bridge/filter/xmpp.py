@@ -3,15 +3,19 @@
 __docformat__ = "restructuredtext en"
 
 from bridge import Element as E
+from bridge import Walker
 from bridge.common import XMPP_CLIENT_NS
 
 __all__ = ['lookup_first_error']
 
 def lookup_first_error(element):
-    for child in element.xml_children:
-        if isinstance(child, E):
-            if child.xml_name == u'error':
-                return child
-            lookup_first_error(child)
+    """
+    Returns the first `error` element found in the subtree
+    of `element`, in document order, `None` if there is none.
+    """
+    START = Walker.START
+    for event, child in Walker(element):
+        if event == START and child is not element and child.xml_name == u'error':
+            return child
 
     return None
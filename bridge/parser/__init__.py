@@ -1,8 +1,11 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import re, sys
+from collections import deque
 
-__all__ = ['get_first_available_parser']
+__all__ = ['get_first_available_parser', 'StanzaReader']
+
+XML_WHITESPACE = u' \t\r\n'
 
 def get_first_available_parser():
     """
@@ -32,3 +35,92 @@ elif sys.platform[:4] == 'java':
     from bridge.parser.bridge_java import Parser, IncrementalParser, DispatchParser
 else:
     from bridge.parser.bridge_default import Parser, IncrementalParser, DispatchParser
+
+class StanzaReader(object):
+    """
+    Pull-style front end to `DispatchParser` for network streams
+    such as XMPP.
+
+    Instead of running dispatchers inline on the parser callback stack,
+    elements completed at `level` are detached from the stream root and
+    queued. The network layer feeds whatever it reads and the application
+    consumes the queued stanzas whenever it is ready:
+
+    >>> reader = StanzaReader(maxsize=100)
+    >>> reader.feed('<stream:stream xmlns="jabber:client" xmlns:stream="http://etherx.jabber.org/streams">')
+    >>> reader.feed('<message><body>hello</body></message><presence/>')
+    >>> for stanza in reader:
+    ...     print stanza.xml_name
+    message
+    presence
+
+    When `maxsize` stanzas are waiting, `readable` returns `False` so that
+    the caller stops reading from the socket until the queue is drained.
+    This is the contract of `asyncore.dispatcher.readable` which makes it
+    straightforward to apply backpressure on a slow consumer without
+    blocking the other streams of the loop:
+
+    >>> class XMPPConnection(asyncore.dispatcher):
+    ...     def readable(self):
+    ...         return self.reader.readable()
+    ...     def handle_read(self):
+    ...         self.reader.feed(self.recv(8192))
+
+    :Parameters:
+      - `level`: level of the stanzas, 1 being the children of the stream root
+      - `maxsize`: number of queued stanzas above which `readable` returns
+        `False`. 0 means unbounded.
+    """
+    def __init__(self, level=1, maxsize=0):
+        self.parser = DispatchParser()
+        self.parser.register_at_level(level, self._enqueue)
+        self.stanzas = deque()
+        self.maxsize = maxsize
+
+    def _enqueue(self, element):
+        parent = element.xml_parent
+        if parent is not None:
+            element.remove_from(parent)
+            # whitespace between stanzas would otherwise pile up in the
+            # stream root for as long as the stream lasts
+            if parent.xml_text and not parent.xml_text.strip(XML_WHITESPACE):
+                parent.xml_text = None
+            children = parent.xml_children
+            if children:
+                children[:] = [child for child in children
+                               if not isinstance(child, basestring)
+                               or child.strip(XML_WHITESPACE)]
+        self.stanzas.append(element)
+
+    def feed(self, chunk):
+        self.parser.feed(chunk)
+
+    def readable(self):
+        """
+        Returns `False` when the queue of stanzas is full.
+        """
+        return not self.maxsize or len(self.stanzas) < self.maxsize
+
+    def reset(self):
+        self.stanzas.clear()
+        self.parser.reset()
+
+    def get_root(self):
+        return self.parser.handler.doc().xml_root
+    root = property(get_root, doc="Stream root element, stanzas excluded")
+
+    def __len__(self):
+        return len(self.stanzas)
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        """
+        Returns the oldest queued stanza. Raises `StopIteration`
+        when none is waiting, the iteration can be resumed
+        once more data has been fed.
+        """
+        if not self.stanzas:
+            raise StopIteration()
+        return self.stanzas.popleft()
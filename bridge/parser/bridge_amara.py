@@ -17,6 +17,7 @@ from bridge import ENCODING
 from bridge.common import ANY_NAMESPACE
 from bridge.parser.bridge_default import DispatchParser as DefaultDispatchParser
 from bridge.parser.bridge_default import DispatchHandler as DefaultDispatchHandler
+from bridge.parser.bridge_default import DispatchTable
 
 class IncrementalHandler(xss.XMLGenerator):
     def __init__(self, out, encoding=ENCODING):
@@ -148,13 +149,45 @@ class DispatchHandler(IncrementalHandler, DefaultDispatchHandler):
         """
         IncrementalHandler.__init__(self, out=None, encoding=ENCODING)
         self._level_dispatchers = {}
-        self._element_dispatchers = {}
+        self._element_dispatchers = DispatchTable()
+        self._start_element_dispatchers = DispatchTable()
+        self._batch_dispatchers = DispatchTable()
         self._element_level_dispatchers = {}
         self._path_dispatchers = {}
         self.default_dispatcher = None
+        self.default_dispatcher_start_element = None
+
+        self._batches = {}
+        self._batch_starts = []
+        self.byte_index = None
 
         self.disable_dispatching()
 
+    def reset(self):
+        IncrementalHandler.reset(self)
+        self._batches = {}
+        self._batch_starts = []
+
+    def endDocument(self):
+        IncrementalHandler.endDocument(self)
+        self.flush()
+
+    def _release(self, elements):
+        for element in elements:
+            parent = element.parentNode
+            if parent is not None:
+                parent.xml_remove_child(element)
+
+    def startElementNS(self, name, qname, attrs):
+        IncrementalHandler.startElementNS(self, name, qname, attrs)
+        current_element = self._current_el
+        if self.enable_start_element_dispatching:
+            for dispatcher in self._start_element_dispatchers.lookup(current_element.namespaceURI,
+                                                                      current_element.localName):
+                dispatcher(current_element)
+        if callable(self.default_dispatcher_start_element):
+            self.default_dispatcher_start_element(current_element)
+
     def endElementNS(self, name, qname):
         self._current_level = current_level = self._current_level - 1
         current_element = self._current_el
@@ -165,15 +198,15 @@ class DispatchHandler(IncrementalHandler, DefaultDispatchHandler):
                 self._level_dispatchers[current_level](current_element)
                 dispatched = True
         if self.enable_element_dispatching:
-            pattern = (current_element.namespaceURI, current_element.localName)
-            if pattern in self._element_dispatchers:
-                self._element_dispatchers[pattern](current_element)
+            for dispatcher in self._element_dispatchers.lookup(current_element.namespaceURI,
+                                                               current_element.localName):
+                dispatcher(current_element)
+                dispatched = True
+        if self.enable_batch_dispatching:
+            for batch in self._batch_dispatchers.lookup(current_element.namespaceURI,
+                                                        current_element.localName):
+                self._add_to_batch(batch, current_element, 0)
                 dispatched = True
-            else:
-                pattern = (ANY_NAMESPACE, current_element.localName)
-                if pattern in self._element_dispatchers:
-                    self._element_dispatchers[pattern](current_element)
-                    dispatched = True
         if self.enable_element_by_level_dispatching:
             pattern = (current_level, (current_element.namespaceURI, current_element.localName))
             if pattern in self._element_level_dispatchers:
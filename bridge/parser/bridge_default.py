@@ -1,11 +1,16 @@
 # -*- coding: utf-8 -*-
 
+import mmap
 import os
 import os.path
+import threading
+import weakref
+from collections import deque
 from StringIO import StringIO
 from time import time
 
-__all__ = ['Parser', 'IncrementalParser', 'DispatchParser']
+__all__ = ['Parser', 'IncrementalParser', 'DispatchParser', 'ParserPool',
+           'DispatchTable', 'DispatchExecutor', 'Projection']
 
 import xml.dom as xd
 import xml.dom.minidom as xdm
@@ -14,26 +19,80 @@ import xml.sax.handler as xsh
 import xml.sax.saxutils as xss
 from xml.sax.saxutils import quoteattr, escape, unescape
 
-from bridge import Element, ENCODING, Attribute, PI, Comment, Document
-from bridge.common import ANY_NAMESPACE
+from bridge import Element, ENCODING, Attribute, PI, Comment, Document, LazyElement, Walker
+from bridge import element_class, _worker_pool, _portable_error
+from bridge.common import ANY_NAMESPACE, ANY_NAME, XMLNS_NS, XMLNS_PREFIX
+from bridge import snapshot
+
+# characters making up ignorable whitespace, see the strip_whitespace option
+XML_WHITESPACE = u' \t\r\n'
+
+def _common_names():
+    from bridge import common
+    names = {}
+    for value in vars(common).itervalues():
+        if isinstance(value, unicode):
+            names[value] = value
+    return names
+
+# read-only, shared by all the tables
+_common = _common_names()
+
+class _Names(dict):
+    def __missing__(self, key):
+        value = self[key] = _common.get(key, key)
+        return value
+
+def names_table(shared=False):
+    """
+    Returns a table used to intern the local names, namespaces and
+    prefixes of the nodes built by a parser so that all the nodes
+    share the same string objects. Namespace comparisons, such as
+    in `Element.get_child`, can then short-circuit on identity.
+
+    A name is interned by indexing the table, ``names[name]``, which
+    returns the first string equal to it ever looked up. The constants
+    of `bridge.common` come first, hence ``element.xml_ns is ATOM10_NS``
+    for any Atom element. They are kept once for all the tables, each
+    table only holds the names its parser has met.
+
+    When ``shared`` is ``True``, the process-wide table is returned
+    instead of a new one. Note that it is never emptied and grows with
+    each name met, which only suits documents of known vocabularies.
+    """
+    if shared:
+        return _shared_names
+    return _Names()
+
+_shared_names = _Names()
 
 class Parser(object):
     def __init__(self):
         self.buffer = []
+        self.strip_comments = False
+        self.strip_pis = False
+        self.strip_whitespace = False
+        self.names = None
         
     def __deserialize_fragment(self, current, parent):
+        intern = self.names.__getitem__
         if current.attributes:
             for key in iter(current.attributes.keys()):
                 attr = current.attributes[key]
-                Attribute(attr.localName, attr.value,
-                          attr.prefix, attr.namespaceURI, parent)
-
-        children_num = len(current.childNodes)
-        children = iter(current.childNodes)
+                Attribute(intern(attr.localName), attr.value,
+                          intern(attr.prefix),
+                          intern(attr.namespaceURI), parent)
+
+        children = current.childNodes
+        if self.strip_comments or self.strip_pis or self.strip_whitespace:
+            # text is the xml_text of the element when it is the only
+            # child kept, whatever was stripped around it
+            children = [child for child in children if not self.__stripped(child)]
+        children_num = len(children)
         for child in children:
             nt = child.nodeType
             if nt == xd.Node.TEXT_NODE:
-                data = escape(child.data)
+                data = child.data
                 if children_num == 1:
                     parent.xml_text = data
                 else:
@@ -50,11 +109,24 @@ class Parser(object):
             elif nt == xd.Node.PROCESSING_INSTRUCTION_NODE:
                 PI(target=unicode(child.target), data=unicode(child.data), parent=parent)
             elif nt == xd.Node.ELEMENT_NODE:
-                element = Element(name=child.localName, prefix=child.prefix,
-                                  namespace=child.namespaceURI, parent=parent)
+                name = intern(child.localName)
+                namespace = intern(child.namespaceURI)
+                element = element_class(namespace, name)(name=name,
+                                                         prefix=intern(child.prefix),
+                                                         namespace=namespace, parent=parent)
 
                 self.__deserialize_fragment(child, element)
 
+    def __stripped(self, node):
+        nt = node.nodeType
+        if nt == xd.Node.TEXT_NODE:
+            return self.strip_whitespace and not node.data.strip(XML_WHITESPACE)
+        elif nt == xd.Node.COMMENT_NODE:
+            return self.strip_comments
+        elif nt == xd.Node.PROCESSING_INSTRUCTION_NODE:
+            return self.strip_pis
+        return False
+
     def __qname(self, name, prefix=None):
         if prefix:
             return "%s:%s" % (prefix, name)
@@ -93,22 +165,27 @@ class Parser(object):
         return False
 
     def __append_text(self, text, as_cdata):
+        # text is kept unescaped in memory, most of it doesn't
+        # need escaping at all so it is checked for first
         if as_cdata:
             self.buffer.append('<![CDATA[')
-        self.buffer.append(text)
-        if as_cdata:
+            self.buffer.append(text)
             self.buffer.append(']]>')
+        elif '&' in text or '<' in text or '>' in text:
+            self.buffer.append(escape(text))
+        else:
+            self.buffer.append(text)
                     
     def __serialize_element(self, element, parent_ns_map=None):
-        for child in iter(element.xml_children):
-            if isinstance(child, basestring):
-                child = child.strip().strip('\n').strip('\r\n')
-                if not child:
-                    continue
-                self.__append_text(child, element.as_cdata)
-            elif isinstance(child, Element):
-                ns_map = {}
-                ns_map.update(parent_ns_map or {})
+        START, END = Walker.START, Walker.END
+        buffer = self.buffer
+        # one (element, qname, namespaces in scope) per open element
+        stack = [(element, None, parent_ns_map or {})]
+        events = iter(Walker(element))
+        events.next()
+        for event, child in events:
+            if event == START:
+                ns_map = dict(stack[-1][2])
                 prefix = ns = name = None
                 if child.xml_prefix:
                     prefix = child.xml_prefix
@@ -118,7 +195,7 @@ class Parser(object):
                 name = child.xml_name
                 qname = self.__qname(name, prefix=prefix)
                 
-                self.buffer.append('<%s' % qname)
+                buffer.append('<%s' % qname)
                 if not self.__is_known(ns_map, prefix, ns):
                     self.__append_namespace(prefix, ns)
 
@@ -136,24 +213,29 @@ class Parser(object):
                         if not self.__is_known(ns_map, prefix, ns):
                             self.__append_namespace(prefix, ns)
                         
-                    self.buffer.append(' %s=%s' % (name, quoteattr(value)))
+                    buffer.append(' %s=%s' % (name, quoteattr(value)))
 
                 if child.xml_text or child.xml_children:
-                    self.buffer.append('>')
+                    buffer.append('>')
                 
                     if child.xml_text:
                         self.__append_text(child.xml_text, child.as_cdata)
 
-                    if child.xml_children:
-                        self.__serialize_element(child, ns_map)
-
-                    self.buffer.append('</%s>' % (qname, ))
+                    stack.append((child, qname, ns_map))
                 else:
-                    self.buffer.append(' />')
+                    buffer.append(' />')
+            elif event == END:
+                if stack[-1][0] is child and child is not element:
+                    buffer.append('</%s>' % (stack.pop()[1], ))
+            elif isinstance(child, basestring):
+                child = child.strip().strip('\n').strip('\r\n')
+                if not child:
+                    continue
+                self.__append_text(child, stack[-1][0].as_cdata)
             elif isinstance(child, Comment):
-                self.buffer.append('<!--%s-->\n' % (child.data,))
+                buffer.append('<!--%s-->\n' % (child.data,))
             elif isinstance(child, PI):
-                self.buffer.append('<?%s %s?>\n' % (child.target, child.data))
+                buffer.append('<?%s %s?>\n' % (child.target, child.data))
 
 
     def serialize(self, document, indent=False, encoding=ENCODING, prefixes=None, omit_declaration=False):
@@ -174,7 +256,18 @@ class Parser(object):
 
         return content.encode(encoding)
 
-    def deserialize(self, source, prefixes=None, strict=False):
+    def deserialize(self, source, prefixes=None, strict=False, lazy=False, processes=None,
+                    strip_comments=False, strip_pis=False, strip_whitespace=False,
+                    share_names=False):
+        self.strip_comments = strip_comments
+        self.strip_pis = strip_pis
+        self.strip_whitespace = strip_whitespace
+        self.names = names_table(share_names)
+        if processes:
+            return self.__deserialize_parallel(source, processes)
+        if lazy:
+            return self.__deserialize_skeleton(source)
+
         doc = None
         if isinstance(source, basestring):
             if os.path.exists(source):
@@ -184,6 +277,9 @@ class Parser(object):
         elif hasattr(source, 'read'):
             doc = xdm.parse(source)
 
+        return self.__deserialize_dom(doc)
+
+    def __deserialize_dom(self, doc):
         document = Document()
 
         self.__deserialize_fragment(doc, document)
@@ -196,39 +292,414 @@ class Parser(object):
             
         return document
 
+    def __deserialize_parallel(self, source, processes, chunks_per_process=4):
+        document = self.__deserialize_skeleton(source)
+        root = document.xml_root
+        if root is None:
+            return document
+
+        indices = [i for i, child in enumerate(root.xml_children) if isinstance(child, _LazyChild)]
+        if not indices:
+            return document
+        skeleton = root.xml_children[indices[0]]._skeleton
+
+        chunk_size = max(1, len(indices) // (processes * chunks_per_process))
+        chunks = [indices[i:i + chunk_size] for i in xrange(0, len(indices), chunk_size)]
+        options = (self.strip_comments, self.strip_pis, self.strip_whitespace)
+        payloads = [(skeleton.wrap([root.xml_children[i] for i in chunk]), options) for chunk in chunks]
+
+        import multiprocessing
+        pool = multiprocessing.Pool(processes)
+        try:
+            for chunk, data in zip(chunks, pool.imap(_deserialize_chunk, payloads)):
+                wrapper = snapshot.loads(data)
+                for index, child in zip(chunk, wrapper.xml_children):
+                    child.xml_parent = root
+                    root.xml_children[index] = child
+        finally:
+            pool.close()
+            pool.join()
+
+        return document
+
+    def __deserialize_skeleton(self, source):
+        data = None
+        if isinstance(source, basestring):
+            if os.path.exists(source):
+                f = open(source, 'rb')
+                try:
+                    if os.fstat(f.fileno()).st_size:
+                        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    else:
+                        # an empty file can't be mapped, expat then
+                        # reports it as it does when parsing eagerly
+                        data = ''
+                finally:
+                    f.close()
+            elif isinstance(source, unicode):
+                data = source.encode(ENCODING)
+            else:
+                data = source
+        elif hasattr(source, 'read'):
+            data = source.read()
+
+        if data[:2] in ('\xff\xfe', '\xfe\xff') or '\x00' in data[:4]:
+            # the children are delimited by looking for ASCII characters
+            # in the bytes, which UTF-16 and UTF-32 documents don't allow
+            return self.__deserialize_dom(xdm.parseString(data[:]))
+
+        skeleton = _Skeleton(data, self.__load_lazy_child, self.strip_comments,
+                             self.strip_pis, self.strip_whitespace)
+        return skeleton.scan()
+
+    def __load_lazy_child(self, skeleton, element):
+        doc = xdm.parseString(skeleton.wrap([element]))
+        for node in doc.documentElement.childNodes:
+            if node.nodeType == xd.Node.ELEMENT_NODE:
+                break
+
+        holder = Element(element.xml_name, prefix=element.xml_prefix,
+                         namespace=element.xml_ns)
+        self.__deserialize_fragment(node, holder)
+        doc.unlink()
+
+        for key in holder.xml_attributes:
+            holder.xml_attributes[key].xml_parent = element
+        for child in holder.xml_children:
+            if not isinstance(child, basestring):
+                child.xml_parent = element
+
+        return holder.xml_text, holder.as_cdata, holder.xml_attributes, holder.xml_children
+
+def _deserialize_chunk(job):
+    """
+    Parses a standalone document produced by `_Skeleton.wrap` in a worker
+    process and sends its top-level element back as a snapshot.
+    """
+    data, (strip_comments, strip_pis, strip_whitespace) = job
+    document = Parser().deserialize(data, strip_comments=strip_comments,
+                                    strip_pis=strip_pis, strip_whitespace=strip_whitespace)
+    return snapshot.dumps(document.xml_root)
+
+class _LazyChild(LazyElement):
+    def __init__(self, skeleton, name, prefix, namespace, parent):
+        LazyElement.__init__(self, name, prefix, namespace, parent, skeleton.load)
+        # kept for the parallel loading until the child is loaded
+        self._skeleton = skeleton
+        self._start = self._end = None
+
+    def _load_content(self):
+        self._skeleton = None
+        return LazyElement._load_content(self)
+
+def _split_expat_name(name):
+    parts = name.split(' ')
+    if len(parts) == 1:
+        return None, name, None
+    elif len(parts) == 2:
+        return parts[0], parts[1], None
+    return parts[0], parts[1], parts[2]
+
+class _Skeleton(object):
+    """
+    Fast scan of a document which only builds the root element and
+    records the byte range of each of its children. Those are
+    `_LazyChild` instances parsed on their own the first time they
+    are accessed, within the namespace context of the root.
+    """
+    chunk_size = 1 << 20
+
+    def __init__(self, data, load, strip_comments=False, strip_pis=False, strip_whitespace=False):
+        self.data = data
+        self.load = lambda element: load(self, element)
+        self.strip_comments = strip_comments
+        self.strip_pis = strip_pis
+        self.strip_whitespace = strip_whitespace
+        self.encoding = None
+        self.namespaces = []
+        # source of the document type declaration, its internal
+        # subset may declare entities the children refer to
+        self.doctype = None
+        self._doctype_start = None
+        self.prolog = self.epilog = None
+
+        self.document = Document()
+        self.root = None
+        self.depth = 0
+        self.has_content = False
+        self.text = []
+        self.in_cdata = False
+
+    def wrap(self, elements):
+        """
+        Returns a standalone document made of the source of the
+        given `_LazyChild` instances within the root namespace context
+        and after the document type declaration of the document.
+        """
+        if self.prolog is None:
+            encoding = self.encoding or ENCODING
+            decls = []
+            for prefix, uri in self.namespaces:
+                if prefix:
+                    decls.append(u' xmlns:%s=%s' % (prefix, quoteattr(uri or u'')))
+                else:
+                    decls.append(u' xmlns=%s' % quoteattr(uri or u''))
+            self.prolog = '%s%s%s' % ((u'<?xml version="1.0" encoding="%s"?>' % encoding).encode(encoding),
+                                      self.doctype or '',
+                                      (u'<_%s>' % u''.join(decls)).encode(encoding))
+            self.epilog = u'</_>'.encode(encoding)
+        data = self.data
+        return '%s%s%s' % (self.prolog, ''.join([data[e._start:e._end] for e in elements]),
+                           self.epilog)
+
+    def scan(self):
+        parser = expat.ParserCreate(namespace_separator=' ')
+        parser.namespace_prefixes = True
+        parser.buffer_text = True
+        parser.XmlDeclHandler = self.xml_decl
+        parser.StartDoctypeDeclHandler = self.start_doctype
+        parser.EndDoctypeDeclHandler = self.end_doctype
+        parser.StartNamespaceDeclHandler = self.start_namespace
+        parser.StartElementHandler = self.start_element
+        parser.EndElementHandler = self.end_element
+        parser.CharacterDataHandler = self.characters
+        parser.StartCdataSectionHandler = self.start_cdata
+        parser.EndCdataSectionHandler = self.end_cdata
+        parser.CommentHandler = self.comment
+        parser.ProcessingInstructionHandler = self.processing_instruction
+        self.parser = parser
+
+        data = self.data
+        size = len(data)
+        for offset in xrange(0, size, self.chunk_size):
+            parser.Parse(data[offset:offset + self.chunk_size], False)
+        parser.Parse('', True)
+        self.parser = None
+
+        return self.document
+
+    def flush_text(self):
+        if self.text:
+            data = u''.join(self.text)
+            self.text = []
+            if self.strip_whitespace and not self.in_cdata and not data.strip(XML_WHITESPACE):
+                return
+            if self.in_cdata:
+                self.root.as_cdata = True
+            self.root.xml_children.append(data)
+
+    def xml_decl(self, version, encoding, standalone):
+        self.encoding = encoding
+
+    def start_doctype(self, name, system_id, public_id, has_internal_subset):
+        # expat points somewhere within the declaration
+        self._doctype_start = self.data.rfind('<!DOCTYPE', 0, self.parser.CurrentByteIndex + 1)
+
+    def end_doctype(self):
+        # and at its closing '>' once it is over
+        self.doctype = self.data[self._doctype_start:self.data.find('>', self.parser.CurrentByteIndex) + 1]
+
+    def start_namespace(self, prefix, uri):
+        if self.depth == 0:
+            self.namespaces.append((prefix, uri))
+
+    def start_element(self, name, attrs):
+        depth = self.depth
+        self.depth = depth + 1
+        if depth > 1:
+            self.has_content = True
+            return
+
+        uri, local_name, prefix = _split_expat_name(name)
+        if depth == 1:
+            self.flush_text()
+            child = _LazyChild(self, local_name, prefix, uri, self.root)
+            child._start = self.parser.CurrentByteIndex
+            self.root.xml_children.append(child)
+            self.has_content = False
+        else:
+            root = self.root = element_class(uri, local_name)(local_name, prefix=prefix, namespace=uri,
+                                                              parent=self.document)
+            for prefix, uri in self.namespaces:
+                if prefix:
+                    Attribute(prefix, uri, 'xmlns', XMLNS_NS, root)
+                else:
+                    Attribute('xmlns', uri, None, XMLNS_NS, root)
+            for name in attrs:
+                uri, local_name, prefix = _split_expat_name(name)
+                Attribute(local_name, attrs[name], prefix, uri, root)
+
+    def end_element(self, name):
+        self.depth = depth = self.depth - 1
+        if depth == 1:
+            # expat reports the end of an element at the start of its
+            # end tag, except for an empty-element tag where it points
+            # right after it
+            data = self.data
+            index = self.parser.CurrentByteIndex
+            if not self.has_content and data[index - 2:index] == '/>':
+                end = index
+            else:
+                end = data.find('>', index) + 1
+            self.root.xml_children[-1]._end = end
+        elif depth == 0:
+            self.flush_text()
+            root = self.root
+            if len(root.xml_children) == 1 and isinstance(root.xml_children[0], basestring):
+                root.xml_text = root.xml_children.pop()
+
+    def characters(self, data):
+        if self.depth == 1:
+            self.text.append(data)
+        else:
+            self.has_content = True
+
+    def start_cdata(self):
+        if self.depth == 1:
+            self.flush_text()
+            self.in_cdata = True
+        else:
+            self.has_content = True
+
+    def end_cdata(self):
+        if self.depth == 1:
+            self.flush_text()
+            self.in_cdata = False
+
+    def comment(self, data):
+        if self.strip_comments:
+            if self.depth > 1:
+                self.has_content = True
+            else:
+                self.flush_text()
+        elif self.depth == 0:
+            Comment(data, self.document)
+        elif self.depth == 1:
+            self.flush_text()
+            Comment(data, self.root)
+        else:
+            self.has_content = True
+
+    def processing_instruction(self, target, data):
+        if self.strip_pis:
+            if self.depth > 1:
+                self.has_content = True
+            else:
+                self.flush_text()
+        elif self.depth == 0:
+            PI(target, data, self.document)
+        elif self.depth == 1:
+            self.flush_text()
+            PI(target, data, self.root)
+        else:
+            self.has_content = True
+
 import xml.sax as xs
 import xml.sax.saxutils as xss
 from xml.parsers import expat
-try:
-    import cStringIO as StringIO
-except ImportError:
-    import StringIO
 from time import time
 
-class IncrementalHandler(xss.XMLGenerator):
-    def __init__(self, out, encoding=ENCODING):
-        xss.XMLGenerator.__init__(self, out, encoding) 
+class IncrementalHandler(xsh.ContentHandler):
+    """Content handler building a bridge tree out of SAX events.
+
+    Only the in-scope namespace prefixes are tracked on top of the
+    tree itself. The ``out`` and ``encoding`` parameters are kept
+    for backward compatibility and are not used.
+
+    The character data SAX delivers in chunks is accumulated and
+    added to the tree as a single string when the next tag, comment,
+    processing instruction or CDATA section boundary is met. It becomes
+    the ``xml_text`` of the element when the element has no children
+    yet and is appended to its ``xml_children`` otherwise.
+
+    Comments, processing instructions and runs of text only made of
+    whitespace are dropped when respectively ``strip_comments``,
+    ``strip_pis`` and ``strip_whitespace`` are set.
+
+    Names, namespaces and prefixes are interned in a table kept for
+    the lifetime of the handler, or in the process-wide one when
+    ``share_names`` is set (see ``names_table``).
+
+    As with ``Parser``, the namespace declarations are kept as
+    attributes, within ``XMLNS_NS``, of the element declaring them.
+    """
+    def __init__(self, out=None, encoding=ENCODING, strip_comments=False,
+                 strip_pis=False, strip_whitespace=False, share_names=False):
+        xsh.ContentHandler.__init__(self)
+        self.names = names_table(share_names)
+        self.strip_comments = strip_comments
+        self.strip_pis = strip_pis
+        self.strip_whitespace = strip_whitespace
+        self._text = []
         self._root = Document()
         self._current_el = self._root
         self._current_level = 0
         self._as_cdata = False
+        self._current_context = {}
+        self._ns_contexts = []
+        self._declarations = []
 
-    def reset(self):
-        if self._root:
-            self._root.forget()
-            self._root = None
-        if self._current_el:
-            self._current_el.forget()
-            self._current_el = None
+    def reset(self, forget=True):
+        """Discards the tree built so far.
+
+        When ``forget`` is ``True`` every element of the tree is
+        torn down with ``Element.forget``. Otherwise the tree is
+        simply dropped, which is much cheaper and leaves untouched the
+        elements which have been handed over to the application.
+        """
+        if forget:
+            if self._root:
+                self._root.forget()
+                self._root = None
+            if self._current_el:
+                self._current_el.forget()
+                self._current_el = None
         self._root = Document()
         self._current_el = self._root
         self._current_level = 0
+        self._current_context = {}
+        self._ns_contexts = []
+        self._declarations = []
+        self._as_cdata = False
+        self._text = []
 
     def startDocument(self):
         self._root = Document()
         self._current_el = self._root
         self._current_level = 0
         self._as_cdata = False
+        self._current_context = {}
+        self._ns_contexts = []
+        self._declarations = []
+        self._text = []
+
+    def _flush_text(self):
+        text = self._text
+        if len(text) == 1:
+            data = text[0]
+        else:
+            data = u''.join(text)
+        self._text = []
+        if self.strip_whitespace and not self._as_cdata and not data.strip(XML_WHITESPACE):
+            return
+        element = self._current_el
+        element.as_cdata = self._as_cdata
+        if not self._as_cdata and not element.xml_text and not element.xml_children:
+            element.xml_text = data
+        else:
+            element.xml_children.append(data)
+
+    def startPrefixMapping(self, prefix, uri):
+        intern = self.names.__getitem__
+        uri = intern(uri)
+        prefix = intern(prefix)
+        self._ns_contexts.append(self._current_context)
+        self._current_context = self._current_context.copy()
+        self._current_context[uri] = prefix
+        self._declarations.append((prefix, uri))
+
+    def endPrefixMapping(self, prefix):
+        self._current_context = self._ns_contexts.pop()
 
     # see http://www.xml.com/pub/a/2003/03/10/python.html
     def _split_qname(self, qname):
@@ -241,23 +712,42 @@ class IncrementalHandler(xss.XMLGenerator):
         return prefix, local
 
     def processingInstruction(self, target, data):
-        PI(target, data, self._current_el)
+        if self._text:
+            self._flush_text()
+        if not self.strip_pis:
+            PI(target, data, self._current_el)
 
     def startElementNS(self, name, qname, attrs):
         #print "$%s%s: %f" % (" " * self._current_level, name, time())
+        if self._text:
+            self._flush_text()
+        intern = self.names.__getitem__
         uri, local_name = name
+        uri = intern(uri)
         prefix = None
         if uri and uri in self._current_context:
             prefix = self._current_context[uri]
         #print "$$%s%s: %f" % (" " * self._current_level, name, time())
-        e = Element(local_name, prefix=prefix, namespace=uri, parent=self._current_el)
+        local_name = intern(local_name)
+        e = element_class(uri, local_name)(local_name, prefix=prefix, namespace=uri,
+                                           parent=self._current_el)
         #print "$$$%s%s: %f" % (" " * self._current_level, name, time())
+
+        if self._declarations:
+            # declared by this element, see startPrefixMapping
+            for prefix, uri in self._declarations:
+                if prefix:
+                    Attribute(prefix, uri, XMLNS_PREFIX, XMLNS_NS, e)
+                else:
+                    Attribute(XMLNS_PREFIX, uri, None, XMLNS_NS, e)
+            self._declarations = []
         
         for name, value in iter(attrs.items()):
             (namespace, local_name) = name
             qname = attrs.getQNameByName(name)
             prefix = self._split_qname(qname)[0]
-            Attribute(local_name, value, prefix, namespace, e)
+            Attribute(intern(local_name), value, intern(prefix),
+                      intern(namespace), e)
         #print "$$$$%s%s: %f" % (" " * self._current_level, name, time())
         
         self._current_el = e
@@ -265,25 +755,29 @@ class IncrementalHandler(xss.XMLGenerator):
         #print "$$$$$%s%s: %f" % (" " * self._current_level, name, time())
         
     def endElementNS(self, name, qname):
+        if self._text:
+            self._flush_text()
         self._current_level = current_level = self._current_level - 1
         self._current_el = self._current_el.xml_parent
 
     def characters(self, content):
-        self._current_el.as_cdata = self._as_cdata
-        if not self._as_cdata and not self._current_el.xml_text:
-            self._current_el.xml_text = content
-        else:
-            self._current_el.xml_children.append(content)
-        self._as_cdata = False
+        self._text.append(content)
 
     def comment(self, data):
-        Comment(data, self._current_el)
+        if self._text:
+            self._flush_text()
+        if not self.strip_comments:
+            Comment(data, self._current_el)
         
     def startCDATA(self):
+        if self._text:
+            self._flush_text()
         self._as_cdata = True
 
     def endCDATA(self):
-        pass
+        if self._text:
+            self._flush_text()
+        self._as_cdata = False
 
     def startDTD(self, name, public_id, system_id):
         pass
@@ -299,26 +793,338 @@ class IncrementalHandler(xss.XMLGenerator):
         return self._root
 
 class IncrementalParser(object):
-    def __init__(self, out=None, encoding=ENCODING):
+    def __init__(self, out=None, encoding=ENCODING, strip_comments=False,
+                 strip_pis=False, strip_whitespace=False, share_names=False):
         self.parser = xs.make_parser()
         self.parser.setFeature(xs.handler.feature_namespaces, True)
-        if not out:
-            out = StringIO.StringIO()
         self.out = out
-        self.handler = IncrementalHandler(self.out, encoding)
+        self.handler = IncrementalHandler(self.out, encoding, strip_comments,
+                                          strip_pis, strip_whitespace, share_names)
         self.parser.setContentHandler(self.handler)
         self.parser.setProperty(xs.handler.property_lexical_handler, self.handler)
 
     def feed(self, chunk):
         self.parser.feed(chunk)
         
-    def reset(self):
-        self.handler.reset()
+    def reset(self, forget=True):
+        self.handler.reset(forget)
         self.parser.reset()
 
+class DispatchTable(object):
+    """Maps elements to the dispatchers registered for them.
+
+    Dispatchers are registered against a ``(namespace, local_name)``
+    key where the namespace can be ``ANY_NAMESPACE`` and the local
+    name can be ``ANY_NAME``. Several dispatchers can share a key and
+    are called by decreasing ``priority`` then in registration order.
+
+    >>> table = DispatchTable()
+    >>> table.add((ANY_NAMESPACE, u'message'), log, priority=10)
+    >>> table.add((XMPP_CLIENT_NS, u'message'), route)
+    >>> table.lookup(XMPP_CLIENT_NS, u'message')
+    (<function log at 0xb7c0c30c>, <function route at 0xb7c0c80c>)
+
+    The dispatchers matching a given element name are resolved once
+    and cached until the registrations change. Each lookup then costs
+    a single dictionary probe however many dispatchers are registered.
+    The cache holds at most ``max_resolved`` names and starts over when
+    full, so that a stream made of ever new names can't grow it forever.
+    """
+    max_resolved = 1024
+
+    def __init__(self):
+        self._entries = {}
+        self._resolved = {}
+        self._counter = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def copy(self):
+        table = DispatchTable()
+        for key in self._entries:
+            table._entries[key] = self._entries[key][:]
+        table._counter = self._counter
+        return table
+
+    def add(self, key, dispatcher, priority=0):
+        """Registers ``dispatcher`` for the ``(namespace, local_name)``
+        ``key``. Registering the same dispatcher twice for a key
+        only updates its priority.
+        """
+        entries = [entry for entry in self._entries.get(key, ()) if entry[2] != dispatcher]
+        self._counter = self._counter + 1
+        entries.append((-priority, self._counter, dispatcher))
+        entries.sort()
+        self._entries[key] = entries
+        self._resolved.clear()
+
+    def remove(self, key, dispatcher=None):
+        """Unregisters ``dispatcher`` from ``key`` or all the
+        dispatchers of ``key`` if ``dispatcher`` is ``None``.
+        """
+        if key not in self._entries:
+            return
+        if dispatcher is None:
+            del self._entries[key]
+        else:
+            entries = [entry for entry in self._entries[key] if entry[2] != dispatcher]
+            if entries:
+                self._entries[key] = entries
+            else:
+                del self._entries[key]
+        self._resolved.clear()
+
+    def clear(self):
+        self._entries.clear()
+        self._resolved.clear()
+
+    def keys(self):
+        return self._entries.keys()
+
+    def get(self, key):
+        """Returns the dispatchers registered for exactly ``key``."""
+        return tuple([entry[2] for entry in self._entries.get(key, ())])
+
+    def lookup(self, namespace, local_name):
+        """Returns the tuple of dispatchers, in calling order,
+        matching an element named ``local_name`` within ``namespace``.
+        """
+        key = (namespace, local_name)
+        dispatchers = self._resolved.get(key)
+        if dispatchers is None:
+            entries = self._entries
+            matching = []
+            for candidate in (key, (ANY_NAMESPACE, local_name),
+                              (namespace, ANY_NAME), (ANY_NAMESPACE, ANY_NAME)):
+                if candidate in entries:
+                    matching.extend(entries[candidate])
+            matching.sort()
+            if len(self._resolved) >= self.max_resolved:
+                self._resolved.clear()
+            dispatchers = self._resolved[key] = tuple([entry[2] for entry in matching])
+        return dispatchers
+
+class Projection(object):
+    """Describes the elements a ``DispatchHandler`` must build when
+    projecting the document (see ``DispatchParser.project``).
+
+    >>> Projection(names=[(XMPP_CLIENT_NS, u'message'), (ANY_NAMESPACE, u'error')])
+    >>> Projection(levels=[1])
+
+    An element is kept, along with its whole subtree, when its
+    ``(namespace, local_name)`` is one of ``names``, ``ANY_NAMESPACE``
+    and ``ANY_NAME`` being supported, or when it sits at one of
+    ``levels``.
+    """
+    def __init__(self, names=(), levels=()):
+        self.names = DispatchTable()
+        for key in names:
+            self.names.add(key, True)
+        self.levels = frozenset(levels)
+        self.max_level = max([-1] + list(self.levels))
+
+    def match(self, namespace, local_name, level):
+        """Returns ``True`` when the element must be built."""
+        return level in self.levels or bool(self.names.lookup(namespace, local_name))
+
+    def deeper(self, level):
+        """Returns ``True`` when an element nested below ``level``
+        may have to be built.
+        """
+        return len(self.names) > 0 or self.max_level > level
+
+def _run_dispatcher(job):
+    dispatcher, element, as_snapshot = job
+    try:
+        if as_snapshot:
+            if isinstance(element, list):
+                element = [snapshot.loads(data) for data in element]
+            else:
+                element = snapshot.loads(element)
+        dispatcher(element)
+    except Exception, e:
+        if as_snapshot:
+            e = _portable_error(e)
+        return e
+
+class DispatchExecutor(object):
+    """
+    Runs dispatchers in a pool of workers so that a slow dispatcher
+    doesn't stall the parsing of the stream.
+
+    >>> p = DispatchParser()
+    >>> p.register_on_element('message', route, namespace=XMPP_CLIENT_NS)
+    >>> p.offload(workers=8, key=lambda e: e.get_attribute_value('from'))
+    >>> p.feed(data)
+    ...
+    >>> p.close()
+
+    Only the dispatchers called on end tags, batch dispatchers
+    included, are offloaded. Start element dispatchers still run
+    inline since the element is being built while they are called.
+
+    When ``ordered`` is ``True`` the calls sharing the same key run one
+    after the other in document order, while calls with different keys
+    run concurrently. The key is the dispatcher itself unless a ``key``
+    callable is given, in which case it is the dispatcher along with
+    what ``key`` returns for the element. With ``ordered`` set to
+    ``False`` no ordering is guaranteed at all.
+
+    At most ``window`` calls can be waiting or running at once. Beyond
+    that ``submit``, and therefore the ``feed`` method of the parser,
+    blocks until a call completes. This bounds the memory held by the
+    elements in flight when the dispatchers can't keep up.
+
+    An exception raised by a dispatcher is re-raised by the next call
+    to ``check``, which the parser performs in ``feed`` and ``close``.
+
+    The elements of an offloaded batch are detached from the tree once
+    their dispatcher has returned, the next time the parser is fed or
+    closed.
+
+    :Parameters:
+      - `workers`: size of the pool (default: number of CPUs)
+      - `executor`: 'thread' or 'process'. Processes receive the
+        elements as snapshots (see bridge.snapshot) and the dispatchers
+        must therefore be picklable, i.e. module level functions.
+        Threads are enough when the dispatchers are dominated by I/O.
+      - `ordered`: see above
+      - `key`: callable returning the ordering key of an element
+      - `window`: maximum number of calls in flight
+    """
+    def __init__(self, workers=None, executor='thread', ordered=True, key=None, window=64):
+        self.pool, self.as_snapshot = _worker_pool(workers, executor)
+        self.ordered = ordered
+        self.key = key
+        self._window = threading.BoundedSemaphore(window)
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._waiting = {}
+        self._pending = 0
+        self._errors = []
+        self._picklable = set()
+
+    def submit(self, dispatcher, element):
+        """Schedules ``dispatcher(element)``, ``element`` being
+        an Element or a list of them.
+
+        Returns a ``threading.Event`` set once the call has completed.
+        Raises ``TypeError`` right away when the dispatcher can't be
+        sent to a worker process.
+        """
+        self.check()
+        if self.as_snapshot and dispatcher not in self._picklable:
+            # the pool silently drops the calls it fails to send
+            import cPickle
+            try:
+                cPickle.dumps(dispatcher, 2)
+            except Exception, e:
+                raise TypeError("%r can't be sent to a worker process: %s" % (dispatcher, e))
+            self._picklable.add(dispatcher)
+        if self.as_snapshot:
+            if isinstance(element, list):
+                job = (dispatcher, [snapshot.dumps(e) for e in element], True)
+            else:
+                job = (dispatcher, snapshot.dumps(element), True)
+        else:
+            job = (dispatcher, element, False)
+
+        key = None
+        if self.ordered:
+            key = dispatcher
+            if self.key is not None:
+                key = (dispatcher, self.key(element))
+
+        done = threading.Event()
+        self._window.acquire()
+        self._lock.acquire()
+        try:
+            self._pending = self._pending + 1
+            if self.ordered:
+                waiting = self._waiting.get(key)
+                if waiting is not None:
+                    # a call with the same key is running already,
+                    # this one is started once it completes
+                    waiting.append((job, done))
+                    return done
+                self._waiting[key] = deque()
+        finally:
+            self._lock.release()
+        self._start(key, job, done)
+        return done
+
+    def _start(self, key, job, done):
+        self.pool.apply_async(_run_dispatcher, (job,),
+                              callback=lambda error: self._done(key, error, done))
+
+    def _done(self, key, error, done):
+        done.set()
+        next_job = None
+        self._lock.acquire()
+        try:
+            if error is not None:
+                self._errors.append(error)
+            self._pending = self._pending - 1
+            if self.ordered:
+                waiting = self._waiting[key]
+                if waiting:
+                    next_job = waiting.popleft()
+                else:
+                    del self._waiting[key]
+            if not self._pending:
+                self._idle.notifyAll()
+        finally:
+            self._lock.release()
+        self._window.release()
+        if next_job is not None:
+            self._start(key, *next_job)
+
+    def check(self):
+        """Re-raises the oldest exception raised by a dispatcher
+        which hasn't been reported yet.
+        """
+        if self._errors:
+            raise self._errors.pop(0)
+
+    def wait(self):
+        """Blocks until every scheduled call has completed."""
+        self._lock.acquire()
+        try:
+            while self._pending:
+                self._idle.wait()
+        finally:
+            self._lock.release()
+
+    def join(self):
+        """Waits for every scheduled call then reports the
+        first exception raised by a dispatcher, if any.
+        """
+        self.wait()
+        self.check()
+
+    def reset(self):
+        """Waits for every scheduled call and discards
+        the exceptions they raised.
+        """
+        self.wait()
+        self._errors = []
+
+    def shutdown(self):
+        """Waits for every scheduled call and stops the workers."""
+        self.wait()
+        self.pool.close()
+        self.pool.join()
+
 class DispatchHandler(IncrementalHandler):
-    def __init__(self, out, encoding='UTF-8'):
-        IncrementalHandler.__init__(self, out=None, encoding=ENCODING)
+    def __init__(self, out, encoding='UTF-8', strip_comments=False,
+                 strip_pis=False, strip_whitespace=False, share_names=False):
+        IncrementalHandler.__init__(self, out=None, encoding=ENCODING,
+                                    strip_comments=strip_comments, strip_pis=strip_pis,
+                                    strip_whitespace=strip_whitespace, share_names=share_names)
         """This handler allows the incremental parsing of an XML document
         while providing simple ways to dispatch at precise point of the
         parsing back to the caller.
@@ -355,14 +1161,84 @@ class DispatchHandler(IncrementalHandler):
         Note also that this class is not thread-safe.
         """
         self._level_dispatchers = {}
-        self._element_dispatchers = {}
+        self._element_dispatchers = DispatchTable()
+        self._start_element_dispatchers = DispatchTable()
+        self._batch_dispatchers = DispatchTable()
         self._element_level_dispatchers = {}
         self._path_dispatchers = {}
         self.default_dispatcher = None
         self.default_dispatcher_start_element = None
 
+        # pending batches and the byte offsets of the start tags of
+        # the elements being batched, see register_batch_on_element
+        self._batches = {}
+        self._batch_starts = []
+        self.byte_index = None
+        # (completion event, elements) of the batches handed over
+        # to the executor and not yet detached from the tree
+        self._offloaded = []
+
+        # when set, a DispatchExecutor running the dispatchers
+        self.executor = None
+
+        # when set, a Projection or True to derive it from the
+        # registered dispatchers, see DispatchParser.project.
+        # _keep_level is the level of the outermost element being
+        # built below the root, _skip_level the level of the element
+        # whose subtree is skipped without even being inspected
+        self.projection = None
+        self._keep_level = None
+        self._skip_level = None
+
         self.disable_dispatching()
 
+    def reset(self, forget=True):
+        if self.executor is not None:
+            self.executor.reset()
+        IncrementalHandler.reset(self, forget)
+        self._batches = {}
+        self._batch_starts = []
+        self._offloaded = []
+        self._keep_level = None
+        self._skip_level = None
+
+    def startDocument(self):
+        IncrementalHandler.startDocument(self)
+        self._keep_level = None
+        self._skip_level = None
+
+    def endDocument(self):
+        self.flush()
+
+    def save_dispatchers(self):
+        """Returns the current dispatchers registrations, along with
+        the projection and the executor, so that they can be put back
+        later on by ``restore_dispatchers``.
+        """
+        return (dict(self._level_dispatchers), self._element_dispatchers.copy(),
+                self._start_element_dispatchers.copy(), self._batch_dispatchers.copy(),
+                dict(self._element_level_dispatchers), dict(self._path_dispatchers),
+                self.default_dispatcher, self.default_dispatcher_start_element,
+                self.enable_level_dispatching, self.enable_element_dispatching,
+                self.enable_start_element_dispatching, self.enable_batch_dispatching,
+                self.enable_element_by_level_dispatching, self.enable_dispatching_by_path,
+                self.projection, self.executor)
+
+    def restore_dispatchers(self, state):
+        (level, element, start_element, batch, element_level, path,
+         self.default_dispatcher, self.default_dispatcher_start_element,
+         self.enable_level_dispatching, self.enable_element_dispatching,
+         self.enable_start_element_dispatching, self.enable_batch_dispatching,
+         self.enable_element_by_level_dispatching, self.enable_dispatching_by_path,
+         self.projection, self.executor) = state
+        self._keep_level = self._skip_level = None
+        self._level_dispatchers = dict(level)
+        self._element_dispatchers = element.copy()
+        self._start_element_dispatchers = start_element.copy()
+        self._batch_dispatchers = batch.copy()
+        self._element_level_dispatchers = dict(element_level)
+        self._path_dispatchers = dict(path)
+
     def register_default(self, handler):
         self.default_dispatcher = handler
 
@@ -380,12 +1256,16 @@ class DispatchHandler(IncrementalHandler):
         self.default_dispatcher_start_element = None
         self.enable_level_dispatching = False
         self.enable_element_dispatching = False
+        self.enable_start_element_dispatching = False
+        self.enable_batch_dispatching = False
         self.enable_element_by_level_dispatching = False
         self.enable_dispatching_by_path = False
 
     def enable_dispatching(self):
         self.enable_level_dispatching = True
         self.enable_element_dispatching = True
+        self.enable_start_element_dispatching = True
+        self.enable_batch_dispatching = True
         self.enable_element_by_level_dispatching = True
         self.enable_dispatching_by_path = True
 
@@ -411,29 +1291,143 @@ class DispatchHandler(IncrementalHandler):
         if len(self._level_dispatchers) == 0:
             self.enable_level_dispatching = False
             
-    def register_on_element(self, local_name, dispatcher, namespace=None):
+    def register_on_element(self, local_name, dispatcher, namespace=None, priority=0):
         """Registers a dispatcher on a given element met during
         the parsing.
 
         The ``local_name`` is the local name of the element. This
         element can be namespaced if you provide the ``namespace``
-        parameter.
+        parameter. ``ANY_NAME`` and ``ANY_NAMESPACE`` can be used
+        as wildcards.
 
         The ``dispatcher`` is a callable object only taking
-        one parameter, a Element instance.
+        one parameter, a Element instance. Several dispatchers can be
+        registered for the same element, they are called by decreasing
+        ``priority``.
         """
         self.enable_element_dispatching = True
-        self._element_dispatchers[(namespace, local_name)] = dispatcher
+        self._element_dispatchers.add((namespace, local_name), dispatcher, priority)
 
-    def unregister_on_element(self, local_name, namespace=None):
-        """Unregisters a dispatcher for a specific element.
+    def unregister_on_element(self, local_name, namespace=None, dispatcher=None):
+        """Unregisters ``dispatcher``, or all the dispatchers if it
+        is ``None``, for a specific element.
         """
-        key = (namespace, local_name)
-        if key in self._element_dispatchers:
-            del self._element_dispatchers[key]
+        self._element_dispatchers.remove((namespace, local_name), dispatcher)
         if len(self._element_dispatchers) == 0:
             self.enable_element_dispatching = False
+
+    def register_on_start_element(self, local_name, dispatcher, namespace=None, priority=0):
+        """Registers a dispatcher called as soon as the start tag of
+        a given element has been parsed. The element passed to the
+        ``dispatcher`` only holds its attributes at that point.
+
+        See ``register_on_element`` for the parameters.
+        """
+        self.enable_start_element_dispatching = True
+        self._start_element_dispatchers.add((namespace, local_name), dispatcher, priority)
+
+    def unregister_on_start_element(self, local_name, namespace=None, dispatcher=None):
+        """Unregisters ``dispatcher``, or all the dispatchers if it
+        is ``None``, called on the start tag of a specific element.
+        """
+        self._start_element_dispatchers.remove((namespace, local_name), dispatcher)
+        if len(self._start_element_dispatchers) == 0:
+            self.enable_start_element_dispatching = False
             
+    def register_batch_on_element(self, local_name, dispatcher, namespace=None,
+                                  size=100, max_bytes=None):
+        """Registers a dispatcher receiving the elements matching
+        ``local_name`` and ``namespace`` by batches rather than one
+        at a time.
+
+        The ``dispatcher`` is a callable object only taking one
+        parameter, a list of Element instances. It is called once
+        ``size`` elements have been collected or, when ``max_bytes``
+        is set, once they add up to roughly that many bytes of the
+        source document. Whatever is left is handed over at the end
+        of the document or when ``flush`` is called.
+
+        Once the dispatcher returns, the elements of the batch are
+        detached from the tree so that it doesn't grow with the
+        document.
+        """
+        self.enable_batch_dispatching = True
+        self._batch_dispatchers.add((namespace, local_name), (dispatcher, size, max_bytes))
+
+    def unregister_batch_on_element(self, local_name, namespace=None, dispatcher=None):
+        """Unregisters ``dispatcher``, or all the batch dispatchers if
+        it is ``None``, for a specific element. Their pending batches
+        are dropped.
+        """
+        key = (namespace, local_name)
+        for batch in self._batch_dispatchers.get(key):
+            if dispatcher is None or batch[0] == dispatcher:
+                self._batch_dispatchers.remove(key, batch)
+                self._batches.pop(batch, None)
+        if len(self._batch_dispatchers) == 0:
+            self.enable_batch_dispatching = False
+
+    def flush(self):
+        """Hands over the pending batches whatever their size."""
+        for batch in self._batches.keys():
+            self._flush_batch(batch)
+
+    def _add_to_batch(self, batch, element, size):
+        pending = self._batches.get(batch)
+        if pending is None:
+            pending = self._batches[batch] = [[], 0]
+        pending[0].append(element)
+        pending[1] = pending[1] + size
+        dispatcher, max_size, max_bytes = batch
+        if len(pending[0]) >= max_size or (max_bytes and pending[1] >= max_bytes):
+            self._flush_batch(batch)
+
+    def _flush_batch(self, batch):
+        elements = self._batches.pop(batch)[0]
+        if self.executor is None:
+            batch[0](elements)
+            self._release(elements)
+        else:
+            done = self.executor.submit(batch[0], elements)
+            self._offloaded.append((done, elements))
+            self._release_offloaded()
+
+    def _release_offloaded(self):
+        # detaches the offloaded batches whose dispatcher has returned,
+        # always from the parsing thread which owns the tree
+        pending = []
+        released = []
+        for done, elements in self._offloaded:
+            if done.isSet():
+                released.extend(elements)
+            else:
+                pending.append((done, elements))
+        self._offloaded = pending
+        if released:
+            self._release(released)
+
+    def _dispatch(self, dispatcher, element):
+        if self.executor is None:
+            dispatcher(element)
+        else:
+            self.executor.submit(dispatcher, element)
+
+    def _release(self, elements):
+        # detaches the elements from their parent in one pass per
+        # parent rather than one list removal per element
+        parents = {}
+        for element in elements:
+            parent = element.xml_parent
+            if parent is not None:
+                if id(parent) not in parents:
+                    parents[id(parent)] = (parent, set())
+                parents[id(parent)][1].add(id(element))
+                element.xml_parent = None
+        for parent, released in parents.itervalues():
+            parent.xml_children = [child for child in parent.xml_children
+                                   if id(child) not in released]
+            parent._invalidate()
+
     def register_on_element_per_level(self, local_name, level, dispatcher, namespace=None):
         """Registers a dispatcher at a given level within the
         XML tree of elements being built as well as for a
@@ -473,13 +1467,98 @@ class DispatchHandler(IncrementalHandler):
         if len(self._path_dispatchers) == 0:
             self.enable_dispatching_by_path = False
 
+    def _projected(self, namespace, local_name, level):
+        projection = self.projection
+        if projection is not True:
+            return projection.match(namespace, local_name, level)
+        if self.default_dispatcher or self.default_dispatcher_start_element:
+            return True
+        if self.enable_level_dispatching and level in self._level_dispatchers:
+            return True
+        if self.enable_element_dispatching and \
+                self._element_dispatchers.lookup(namespace, local_name):
+            return True
+        if self.enable_start_element_dispatching and \
+                self._start_element_dispatchers.lookup(namespace, local_name):
+            return True
+        if self.enable_batch_dispatching and \
+                self._batch_dispatchers.lookup(namespace, local_name):
+            return True
+        return False
+
+    def _projected_deeper(self, level):
+        projection = self.projection
+        if projection is not True:
+            return projection.deeper(level)
+        if (self.enable_element_dispatching and len(self._element_dispatchers)) or \
+                (self.enable_start_element_dispatching and len(self._start_element_dispatchers)) or \
+                (self.enable_batch_dispatching and len(self._batch_dispatchers)):
+            return True
+        return self.enable_level_dispatching and \
+            max([-1] + self._level_dispatchers.keys()) > level
+
+    def characters(self, content):
+        if self.projection is not None and self._current_level > 1 and self._keep_level is None:
+            return
+        self._text.append(content)
+
+    def comment(self, data):
+        if self.projection is not None and self._current_level > 1 and self._keep_level is None:
+            return
+        IncrementalHandler.comment(self, data)
+
+    def processingInstruction(self, target, data):
+        if self.projection is not None and self._current_level > 1 and self._keep_level is None:
+            return
+        IncrementalHandler.processingInstruction(self, target, data)
+
     def startElementNS(self, name, qname, attrs):
         #print "%s: %f" % (name, time())
+        if self.projection is not None and self._keep_level is None:
+            if self._text:
+                self._flush_text()
+            level = self._current_level
+            if self._skip_level is not None:
+                self._current_level = level + 1
+                self._declarations = []
+                return
+            if level > 0:
+                if not self._projected(name[0], name[1], level):
+                    # the element isn't built but its descendants
+                    # are still looked at unless none can match
+                    self._current_level = level + 1
+                    self._declarations = []
+                    if not self._projected_deeper(level):
+                        self._skip_level = level
+                    return
+                self._keep_level = level
         IncrementalHandler.startElementNS(self, name, qname, attrs)
+        if self.enable_start_element_dispatching:
+            current_element = self._current_el
+            for dispatcher in self._start_element_dispatchers.lookup(current_element.xml_ns,
+                                                                      current_element.xml_name):
+                dispatcher(current_element)
+        if self.enable_batch_dispatching and self.byte_index is not None:
+            current_element = self._current_el
+            if self._batch_dispatchers.lookup(current_element.xml_ns, current_element.xml_name):
+                self._batch_starts.append(self.byte_index())
         if self.default_dispatcher_start_element:
             self.default_dispatcher_start_element(self._current_el)
 
     def endElementNS(self, name, qname):
+        if self.projection is not None:
+            level = self._current_level - 1
+            if self._skip_level is not None or (level > 0 and self._keep_level is None):
+                if self._text:
+                    self._flush_text()
+                self._current_level = level
+                if level == self._skip_level:
+                    self._skip_level = None
+                return
+            if level == self._keep_level:
+                self._keep_level = None
+        if self._text:
+            self._flush_text()
         self._current_level = current_level = self._current_level - 1
         if not self._current_el:
             return
@@ -488,30 +1567,112 @@ class DispatchHandler(IncrementalHandler):
 
         dispatched = False
         
+        if self.enable_level_dispatching:
+            if current_level in self._level_dispatchers:
+                self._dispatch(self._level_dispatchers[current_level], current_element)
+                dispatched = True
+
         if self.enable_element_dispatching:
-            pattern = (current_element.xml_ns, current_element.xml_name)
-            if pattern in self._element_dispatchers:
-                self._element_dispatchers[pattern](current_element)
+            for dispatcher in self._element_dispatchers.lookup(current_element.xml_ns,
+                                                               current_element.xml_name):
+                self._dispatch(dispatcher, current_element)
+                dispatched = True
+
+        if self.enable_batch_dispatching:
+            batches = self._batch_dispatchers.lookup(current_element.xml_ns,
+                                                     current_element.xml_name)
+            if batches:
+                size = 0
+                if self.byte_index is not None and self._batch_starts:
+                    size = self.byte_index() - self._batch_starts.pop()
+                for batch in batches:
+                    self._add_to_batch(batch, current_element, size)
                 dispatched = True
                 
         if not dispatched and self.default_dispatcher:
-            self.default_dispatcher(current_element)
+            self._dispatch(self.default_dispatcher, current_element)
             
         self._current_el = parent_element
 
 class DispatchParser(object):
-    def __init__(self, out=None, encoding=ENCODING):
+    def __init__(self, out=None, encoding=ENCODING, strip_comments=False,
+                 strip_pis=False, strip_whitespace=False, share_names=False):
         self.parser = xs.make_parser()
         self.parser.setFeature(xs.handler.feature_namespaces, True)
-        if not out:
-            out = StringIO.StringIO()
         self.out = out
-        self.handler = DispatchHandler(self.out, encoding)
+        self.handler = DispatchHandler(self.out, encoding, strip_comments,
+                                       strip_pis, strip_whitespace, share_names)
+        self.handler.byte_index = self._byte_index
         self.parser.setContentHandler(self.handler)
         self.parser.setProperty(xs.handler.property_lexical_handler, self.handler)
     
+    def _byte_index(self):
+        return self.parser._parser.CurrentByteIndex
+
     def feed(self, chunk):
         self.parser.feed(chunk)
+        if self.handler.executor is not None:
+            self.handler._release_offloaded()
+            self.handler.executor.check()
+
+    def flush(self):
+        """Hands over the pending batches whatever their size."""
+        self.handler.flush()
+
+    def close(self):
+        """Signals the end of the document, which notably hands
+        over the pending batches. When dispatchers are offloaded,
+        waits for them to complete.
+        """
+        self.parser.close()
+        if self.handler.executor is not None:
+            self.handler.executor.wait()
+            self.handler._release_offloaded()
+            self.handler.executor.check()
+
+    def project(self, projection=True):
+        """Only builds the elements which are going to be dispatched.
+
+        With ``projection`` set to ``True`` the elements to build are
+        derived from the dispatchers registered at the time the element
+        is met. Alternatively ``projection`` can be an explicit
+        ``Projection``. ``None`` or ``False`` turn projecting off.
+
+        >>> p = DispatchParser()
+        >>> p.register_on_element('message', route, namespace=XMPP_CLIENT_NS)
+        >>> p.project()
+        >>> p.feed(data)
+
+        The root element is always built. Below it, an element matching
+        a dispatcher is built along with its whole subtree and attached
+        to its closest built ancestor. The other elements, their
+        attributes, text, comments and processing instructions are
+        dropped as they are parsed. Their descendants are still looked
+        at, unless no dispatcher can match below them, in which case
+        their subtree is skipped altogether.
+
+        Note that a default dispatcher matches every element and
+        therefore disables the projection.
+        """
+        self.handler.projection = projection or None
+        self.handler._keep_level = self.handler._skip_level = None
+
+    def offload(self, workers=None, executor='thread', ordered=True, key=None, window=64):
+        """Runs the dispatchers in a pool of workers rather than
+        inline. See ``DispatchExecutor`` for the parameters.
+
+        Alternatively an existing ``DispatchExecutor`` can be passed
+        as ``executor`` to share its workers between several parsers.
+        The exceptions raised by the dispatchers are then reported to
+        whichever parser checks for them first.
+
+        Returns the executor, call its ``shutdown`` method once
+        the parser is not needed anymore.
+        """
+        if not isinstance(executor, DispatchExecutor):
+            executor = DispatchExecutor(workers, executor, ordered, key, window)
+        self.handler.executor = executor
+        return executor
 
     def register_default(self, handler):
         self.handler.register_default(handler)
@@ -525,8 +1686,8 @@ class DispatchParser(object):
     def unregister_default_start_element(self):
         self.handler.unregister_default_start_element()
           
-    def reset(self):
-        self.handler.reset()
+    def reset(self, forget=True):
+        self.handler.reset(forget)
         self.parser.reset()
 
     def disable_dispatching(self):
@@ -553,24 +1714,78 @@ class DispatchParser(object):
         """
         self.handler.unregister_at_level(level, dispatcher)
             
-    def register_on_element(self, local_name, dispatcher, namespace=None):
+    def register_on_element(self, local_name, dispatcher, namespace=None, priority=0):
         """Registers a dispatcher on a given element met during
         the parsing.
 
         The ``local_name`` is the local name of the element. This
         element can be namespaced if you provide the ``namespace``
-        parameter.
+        parameter. ``ANY_NAME`` and ``ANY_NAMESPACE`` can be used
+        as wildcards.
 
         The ``dispatcher`` is a callable object only taking
-        one parameter, a Element instance.
+        one parameter, a Element instance. Several dispatchers can be
+        registered for the same element, they are called by decreasing
+        ``priority``.
+        """
+        self.handler.register_on_element(local_name, dispatcher, namespace, priority)
+
+    def unregister_on_element(self, local_name, namespace=None, dispatcher=None):
+        """Unregisters ``dispatcher``, or all the dispatchers if it
+        is ``None``, for a specific element.
         """
-        self.handler.register_on_element(local_name, dispatcher, namespace)
+        self.handler.unregister_on_element(local_name, namespace, dispatcher)
+
+    def register_on_start_element(self, local_name, dispatcher, namespace=None, priority=0):
+        """Registers a dispatcher called as soon as the start tag of
+        a given element has been parsed. The element passed to the
+        ``dispatcher`` only holds its attributes at that point.
 
-    def unregister_on_element(self, local_name, namespace=None):
-        """Unregisters a dispatcher for a specific element.
+        See ``register_on_element`` for the parameters.
         """
-        self.handler.unregister_on_element(local_name, namespace)
+        self.handler.register_on_start_element(local_name, dispatcher, namespace, priority)
+
+    def unregister_on_start_element(self, local_name, namespace=None, dispatcher=None):
+        """Unregisters ``dispatcher``, or all the dispatchers if it
+        is ``None``, called on the start tag of a specific element.
+        """
+        self.handler.unregister_on_start_element(local_name, namespace, dispatcher)
             
+    def register_batch_on_element(self, local_name, dispatcher, namespace=None,
+                                  size=100, max_bytes=None):
+        """Registers a dispatcher receiving the elements matching
+        ``local_name`` and ``namespace`` by batches rather than one
+        at a time:
+
+        >>> def store(entries):
+        ...     cursor.executemany(INSERT_ENTRY, [(e.get_child('id', ATOM10_NS).xml_text,
+        ...                                        e.xml()) for e in entries])
+        ...
+        >>> p = DispatchParser()
+        >>> p.register_batch_on_element('entry', store, namespace=ATOM10_NS,
+        ...                             size=500, max_bytes=4 * 1024 * 1024)
+        >>> for chunk in source:
+        ...     p.feed(chunk)
+        >>> p.close()
+
+        The ``dispatcher`` is called once ``size`` elements have been
+        collected or, when ``max_bytes`` is set, once they add up to
+        roughly that many bytes of the source document. Whatever is
+        left is handed over by ``close`` or ``flush``.
+
+        Once the dispatcher returns, the elements of the batch are
+        detached from the tree so that it doesn't grow with the
+        document.
+        """
+        self.handler.register_batch_on_element(local_name, dispatcher, namespace,
+                                               size, max_bytes)
+
+    def unregister_batch_on_element(self, local_name, namespace=None, dispatcher=None):
+        """Unregisters ``dispatcher``, or all the batch dispatchers if
+        it is ``None``, for a specific element.
+        """
+        self.handler.unregister_batch_on_element(local_name, namespace, dispatcher)
+
     def register_on_element_per_level(self, local_name, level, dispatcher, namespace=None):
         """Registers a dispatcher at a given level within the
         XML tree of elements being built as well as for a
@@ -600,3 +1815,101 @@ class DispatchParser(object):
 
     def unregister_by_path(self, path):
         self.handler.unregister_by_path(path)
+
+class ParserPool(object):
+    """
+    Pool of parsers for applications opening and closing many
+    streams, such as an XMPP gateway.
+
+    Dispatchers are registered once on the pool, with the same methods
+    as on a `DispatchParser`, and act as a template for every parser it
+    hands out:
+
+    >>> pool = ParserPool(maxsize=1000)
+    >>> pool.register_on_element('message', on_message, namespace=XMPP_CLIENT_NS)
+    >>> parser = pool.acquire()
+    >>> parser.feed(data)
+    ...
+    >>> pool.release(parser)
+
+    Releasing a parser resets it without tearing down the tree it built
+    (see `IncrementalHandler.reset`) and puts back the template
+    registrations, projection and executor included, so changes made
+    while the parser was in use do not leak into the next session. A
+    parser created before the template last changed, or by another pool,
+    is discarded rather than pooled since it can't be brought back to
+    the current template.
+
+    Note that this class is not thread-safe.
+
+    :Parameters:
+      - `parser_class`: `DispatchParser` or `IncrementalParser`
+      - `maxsize`: maximum number of idle parsers kept around
+      - `options`: keyword arguments given to `parser_class`, such
+        as `strip_whitespace`
+    """
+    def __init__(self, parser_class=None, maxsize=64, **options):
+        self.parser_class = parser_class or DispatchParser
+        self.maxsize = maxsize
+        self.options = options
+        self.idle = []
+        self.template = []
+        self.dispatchers = None
+        # version of the template each parser was created with
+        self.generation = 0
+        self.generations = weakref.WeakKeyDictionary()
+
+    def __record(name):
+        def record(self, *args, **kwargs):
+            self.template.append((name, args, kwargs))
+            self.dispatchers = None
+            self.generation = self.generation + 1
+            self.idle = []
+        record.__name__ = name
+        record.__doc__ = getattr(DispatchParser, name).__doc__
+        return record
+
+    register_default = __record('register_default')
+    register_default_start_element = __record('register_default_start_element')
+    register_at_level = __record('register_at_level')
+    register_on_element = __record('register_on_element')
+    register_on_start_element = __record('register_on_start_element')
+    register_batch_on_element = __record('register_batch_on_element')
+    project = __record('project')
+    register_on_element_per_level = __record('register_on_element_per_level')
+    register_by_path = __record('register_by_path')
+    disable_dispatching = __record('disable_dispatching')
+    enable_dispatching = __record('enable_dispatching')
+    del __record
+
+    def create(self):
+        """Creates a new parser set up with the template registrations."""
+        parser = self.parser_class(**self.options)
+        for name, args, kwargs in self.template:
+            getattr(parser, name)(*args, **kwargs)
+        if self.dispatchers is None and hasattr(parser.handler, 'save_dispatchers'):
+            self.dispatchers = parser.handler.save_dispatchers()
+        self.generations[parser] = self.generation
+        return parser
+
+    def acquire(self):
+        """Returns an idle parser or a new one if none is available."""
+        try:
+            return self.idle.pop()
+        except IndexError:
+            return self.create()
+
+    def release(self, parser):
+        """
+        Hands `parser` back to the pool once its stream is over.
+        Releasing a parser that is already idle does nothing.
+        """
+        if parser in self.idle:
+            return
+        parser.reset(forget=False)
+        if self.generations.get(parser) != self.generation:
+            return
+        if self.dispatchers is not None:
+            parser.handler.restore_dispatchers(self.dispatchers)
+        if len(self.idle) < self.maxsize:
+            self.idle.append(parser)
@@ -34,7 +34,7 @@ class Parser(object):
         for child in children:
             nt = child.nodeType
             if nt == xd.Node.TEXT_NODE:
-                data = escape(child.data)
+                data = child.data
                 if len(children) == 1:
                     parent.xml_text = data
                 else:
@@ -94,11 +94,16 @@ class Parser(object):
         return False
 
     def __append_text(self, text, as_cdata):
+        # text is kept unescaped in memory, most of it doesn't
+        # need escaping at all so it is checked for first
         if as_cdata:
             self.buffer.append('<![CDATA[')
-        self.buffer.append(text)
-        if as_cdata:
+            self.buffer.append(text)
             self.buffer.append(']]>')
+        elif '&' in text or '<' in text or '>' in text:
+            self.buffer.append(escape(text))
+        else:
+            self.buffer.append(text)
                     
     def __serialize_element(self, element, parent_ns_map=None):
         for child in iter(element.xml_children):
@@ -0,0 +1,416 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compact binary snapshots of bridge trees.
+
+Reparsing a large XML document is costly. A snapshot stores an already
+parsed tree so that it can be rebuilt without going through an XML parser
+at all:
+
+>>> from bridge import Element
+>>> from bridge import snapshot
+>>> doc = Element.load('<feed xmlns="http://www.w3.org/2005/Atom"><id>x</id></feed>')
+>>> data = snapshot.dumps(doc)
+>>> snapshot.loads(data).xml_root.get_child('id', u'http://www.w3.org/2005/Atom').xml_text
+u'x'
+
+A snapshot is laid out as follows (all integers are little-endian):
+
+  - the magic number ``BRS`` followed by the format version byte
+  - the table of interned names, namespaces and prefixes: a 32-bit count
+    followed by length-prefixed UTF-8 strings. Index 0 stands for `None`.
+  - the flat array of nodes in document order. Each element record holds
+    its name, namespace and prefix as indices in the table, its text,
+    its attributes, its number of children and the byte length of the
+    block holding its children so that a subtree can be skipped without
+    being decoded.
+
+Texts are stored inline as a 32-bit length (-1 for `None`) followed by
+their UTF-8 bytes.
+
+Large snapshots can also be memory-mapped with `MappedSnapshot`. Elements
+are then only decoded as the tree is navigated so that untouched subtrees
+cost nothing:
+
+>>> snapshot.dump(doc, 'feed.snapshot')
+>>> store = snapshot.MappedSnapshot('feed.snapshot')
+>>> store.root.xml_root
+<feed element at 0xb7c0c30cL />
+>>> store.close()
+"""
+__docformat__ = "restructuredtext en"
+
+import mmap
+import os.path
+import struct
+
+from bridge import Element, Attribute, Document, Comment, PI, LazyElement
+from bridge import element_class
+
+__all__ = ['dump', 'dumps', 'load', 'loads', 'MappedSnapshot',
+           'BridgeSnapshotException']
+
+MAGIC = 'BRS'
+VERSION = 1
+
+_DOCUMENT = 0
+_ELEMENT = 1
+_TEXT = 2
+_COMMENT = 3
+_PI = 4
+
+_CDATA_FLAG = 1
+
+_kind = struct.Struct('<B')
+_uint = struct.Struct('<I')
+_int = struct.Struct('<i')
+_names = struct.Struct('<IIIB')
+_children = struct.Struct('<II')
+
+class BridgeSnapshotException(StandardError):
+    def __init__(self, message=''):
+        self.message = message
+
+    def __str__(self):
+        return self.message
+
+class _StringTable(object):
+    def __init__(self):
+        self.indices = {None: 0}
+        self.strings = [None]
+
+    def index(self, value):
+        if value in self.indices:
+            return self.indices[value]
+        index = self.indices[value] = len(self.strings)
+        self.strings.append(value)
+        return index
+
+    def encode(self):
+        chunks = [_uint.pack(len(self.strings) - 1)]
+        for value in self.strings[1:]:
+            if isinstance(value, unicode):
+                value = value.encode('utf-8')
+            chunks.append(_uint.pack(len(value)))
+            chunks.append(value)
+        return ''.join(chunks)
+
+def _pack_text(out, text):
+    if text is None:
+        out.extend(_int.pack(-1))
+        return
+    if isinstance(text, unicode):
+        text = text.encode('utf-8')
+    out.extend(_int.pack(len(text)))
+    out.extend(text)
+
+def _write_node(out, strings, node):
+    """
+    Appends the record of `node` to `out`. If `node` can have children,
+    returns the offset of the placeholder which must be patched with the
+    length of the children block once it has been written.
+    """
+    if isinstance(node, basestring):
+        out.extend(_kind.pack(_TEXT))
+        _pack_text(out, node)
+    elif isinstance(node, Document):
+        out.extend(_kind.pack(_DOCUMENT))
+        out.extend(_uint.pack(len(node.xml_children)))
+        out.extend(_uint.pack(0))
+        return len(out) - 4
+    elif isinstance(node, Element):
+        out.extend(_kind.pack(_ELEMENT))
+        flags = 0
+        if node.as_cdata:
+            flags |= _CDATA_FLAG
+        out.extend(_names.pack(strings.index(node.xml_name), strings.index(node.xml_ns),
+                               strings.index(node.xml_prefix), flags))
+        _pack_text(out, node.xml_text)
+        attributes = node.xml_attributes
+        out.extend(_uint.pack(len(attributes)))
+        for key in attributes:
+            attr = attributes[key]
+            out.extend(_names.pack(strings.index(attr.xml_name), strings.index(attr.xml_ns),
+                                   strings.index(attr.xml_prefix), 0))
+            _pack_text(out, attr.xml_text)
+        out.extend(_uint.pack(len(node.xml_children)))
+        out.extend(_uint.pack(0))
+        return len(out) - 4
+    elif isinstance(node, Comment):
+        out.extend(_kind.pack(_COMMENT))
+        _pack_text(out, node.data)
+    elif isinstance(node, PI):
+        out.extend(_kind.pack(_PI))
+        _pack_text(out, node.target)
+        _pack_text(out, node.data)
+    else:
+        raise BridgeSnapshotException("Cannot snapshot node %r" % (node, ))
+
+def dumps(node):
+    """
+    Returns the snapshot of `node` as a string.
+
+    :Parameters:
+      - `node`: a bridge.Document or a bridge.Element. In the latter case
+        only the subtree starting at the element is stored.
+    """
+    if not isinstance(node, Element):
+        raise BridgeSnapshotException("Only documents and elements can be snapshot")
+
+    strings = _StringTable()
+    out = bytearray()
+    pending = [(iter(node.xml_children), _write_node(out, strings, node))]
+    while pending:
+        children, placeholder = pending[-1]
+        for child in children:
+            child_placeholder = _write_node(out, strings, child)
+            if child_placeholder is not None:
+                pending.append((iter(child.xml_children), child_placeholder))
+                break
+        else:
+            pending.pop()
+            _uint.pack_into(out, placeholder, len(out) - placeholder - 4)
+
+    return '%s%s%s%s' % (MAGIC, chr(VERSION), strings.encode(), str(out))
+
+def dump(node, target):
+    """
+    Writes the snapshot of `node` to `target` which can be a file path
+    or a file object.
+    """
+    data = dumps(node)
+    if hasattr(target, 'write'):
+        target.write(data)
+    else:
+        f = open(target, 'wb')
+        try:
+            f.write(data)
+        finally:
+            f.close()
+
+def _read_header(data):
+    if data[:3] != MAGIC:
+        raise BridgeSnapshotException("Not a bridge snapshot")
+    if ord(data[3]) != VERSION:
+        raise BridgeSnapshotException("Unsupported snapshot version %d" % ord(data[3]))
+
+    count = _uint.unpack_from(data, 4)[0]
+    offset = 8
+    strings = [None]
+    for i in xrange(count):
+        length = _uint.unpack_from(data, offset)[0]
+        offset += 4
+        strings.append(data[offset:offset + length].decode('utf-8'))
+        offset += length
+
+    return strings, offset
+
+def loads(data):
+    """
+    Rebuilds the bridge.Document or bridge.Element stored in the
+    snapshot `data`.
+    """
+    strings, offset = _read_header(data)
+
+    unpack_kind = _kind.unpack_from
+    unpack_uint = _uint.unpack_from
+    unpack_int = _int.unpack_from
+    unpack_names = _names.unpack_from
+    unpack_children = _children.unpack_from
+
+    def read_text(offset):
+        length = unpack_int(data, offset)[0]
+        offset += 4
+        if length == -1:
+            return None, offset
+        return data[offset:offset + length].decode('utf-8'), offset + length
+
+    result = None
+    parent = None
+    remaining = 1
+    stack = []
+    while True:
+        while remaining == 0:
+            if not stack:
+                return result
+            parent, remaining = stack.pop()
+        remaining -= 1
+
+        kind = unpack_kind(data, offset)[0]
+        offset += 1
+        if kind == _TEXT:
+            text, offset = read_text(offset)
+            parent.xml_children.append(text)
+        elif kind == _ELEMENT:
+            name, ns, prefix, flags = unpack_names(data, offset)
+            offset += 13
+            text, offset = read_text(offset)
+            name, ns = strings[name], strings[ns]
+            node = element_class(ns, name)(name, text, prefix=strings[prefix],
+                                           namespace=ns, parent=parent)
+            if flags & _CDATA_FLAG:
+                node.as_cdata = True
+            count = unpack_uint(data, offset)[0]
+            offset += 4
+            for i in xrange(count):
+                name, ns, prefix, flags = unpack_names(data, offset)
+                offset += 13
+                text, offset = read_text(offset)
+                Attribute(strings[name], text, strings[prefix], strings[ns], node)
+            count = unpack_children(data, offset)[0]
+            offset += 8
+            if result is None:
+                result = node
+            if count:
+                stack.append((parent, remaining))
+                parent, remaining = node, count
+        elif kind == _DOCUMENT:
+            if result is not None:
+                raise BridgeSnapshotException("Unexpected document record")
+            result = parent = Document()
+            remaining = unpack_children(data, offset)[0]
+            offset += 8
+        elif kind == _COMMENT:
+            text, offset = read_text(offset)
+            Comment(text, parent)
+        elif kind == _PI:
+            target, offset = read_text(offset)
+            text, offset = read_text(offset)
+            PI(target, text, parent)
+        else:
+            raise BridgeSnapshotException("Unknown record type %d" % kind)
+
+def load(source):
+    """
+    Rebuilds the tree stored in `source` which can be a file path,
+    a file object or a snapshot string.
+    """
+    if hasattr(source, 'read'):
+        return loads(source.read())
+    if source[:3] != MAGIC and os.path.exists(source):
+        f = open(source, 'rb')
+        try:
+            return loads(f.read())
+        finally:
+            f.close()
+    return loads(source)
+
+class _MappedElement(LazyElement):
+    def __init__(self, snapshot, offset, name=None, prefix=None, namespace=None, parent=None):
+        LazyElement.__init__(self, name, prefix, namespace, parent, snapshot.read_content)
+        self._offset = offset
+
+class _MappedDocument(_MappedElement, Document):
+    def __repr__(self):
+        return Document.__repr__(self)
+
+class MappedSnapshot(object):
+    """
+    Read-only view of a snapshot file mapped in memory.
+
+    The `root` attribute is the top-level bridge.Document or bridge.Element
+    of the snapshot. Its content, and that of every element below it,
+    is decoded from the mapping the first time it is accessed
+    (`xml_children`, `get_child`, `lookup`...) so that memory usage is
+    proportional to the part of the tree actually visited.
+
+    The elements must not be materialized after `close` has been called.
+
+    :Parameters:
+      - `path`: path of a file written by `dump`
+    """
+    def __init__(self, path):
+        f = open(path, 'rb')
+        try:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            f.close()
+        self.strings, offset = _read_header(self.map)
+        self.root = self.read_node(offset, None)[0]
+
+    def close(self):
+        self.map.close()
+
+    def read_text(self, offset):
+        length = _int.unpack_from(self.map, offset)[0]
+        offset += 4
+        if length == -1:
+            return None, offset
+        return self.map[offset:offset + length].decode('utf-8'), offset + length
+
+    def skip_text(self, offset):
+        length = _int.unpack_from(self.map, offset)[0]
+        if length == -1:
+            return offset + 4
+        return offset + 4 + length
+
+    def read_node(self, offset, parent):
+        """
+        Decodes the record at `offset` without decoding the subtree of
+        an element. Returns the node and the offset of the next record.
+        """
+        data = self.map
+        kind = _kind.unpack_from(data, offset)[0]
+        offset += 1
+        if kind == _TEXT:
+            return self.read_text(offset)
+        elif kind == _ELEMENT:
+            strings = self.strings
+            name, ns, prefix, flags = _names.unpack_from(data, offset)
+            offset += 13
+            node = _MappedElement(self, offset, strings[name], strings[prefix],
+                                  strings[ns], parent)
+            offset = self.skip_text(offset)
+            count = _uint.unpack_from(data, offset)[0]
+            offset += 4
+            for i in xrange(count):
+                offset = self.skip_text(offset + 13)
+            count, length = _children.unpack_from(data, offset)
+            return node, offset + 8 + length
+        elif kind == _DOCUMENT:
+            node = _MappedDocument(self, offset)
+            count, length = _children.unpack_from(data, offset)
+            return node, offset + 8 + length
+        elif kind == _COMMENT:
+            text, offset = self.read_text(offset)
+            node = Comment(text)
+        elif kind == _PI:
+            target, offset = self.read_text(offset)
+            text, offset = self.read_text(offset)
+            node = PI(target, text)
+        else:
+            raise BridgeSnapshotException("Unknown record type %d" % kind)
+        node.xml_parent = parent
+        return node, offset
+
+    def read_content(self, element):
+        """
+        Decodes the text, attributes and direct children of `element`.
+        """
+        data = self.map
+        strings = self.strings
+        offset = element._offset
+        text = None
+        as_cdata = False
+        attributes = {}
+        if not isinstance(element, Document):
+            flags = _names.unpack_from(data, offset - 13)[3]
+            as_cdata = bool(flags & _CDATA_FLAG)
+            text, offset = self.read_text(offset)
+            count = _uint.unpack_from(data, offset)[0]
+            offset += 4
+            for i in xrange(count):
+                name, ns, prefix, flags = _names.unpack_from(data, offset)
+                value, offset = self.read_text(offset + 13)
+                attr = Attribute(strings[name], value, strings[prefix], strings[ns])
+                attr.xml_parent = element
+                attributes[(attr.xml_ns, attr.xml_name)] = attr
+
+        count = _children.unpack_from(data, offset)[0]
+        offset += 8
+        children = []
+        for i in xrange(count):
+            child, offset = self.read_node(offset, element)
+            children.append(child)
+
+        return text, as_cdata, attributes, children
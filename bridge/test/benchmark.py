@@ -0,0 +1,678 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Rough benchmarks of the bridge hot paths.
+
+Run them all:
+
+    python benchmark.py
+
+or only some of them:
+
+    python benchmark.py snapshot
+"""
+import sys
+import time
+
+from bridge import Element
+from bridge.common import ATOM10_NS
+
+def make_feed(entries=1000):
+    chunks = ['<?xml version="1.0" encoding="UTF-8"?>\n',
+              '<feed xmlns="%s" xmlns:thr="http://purl.org/syndication/thread/1.0">\n' % ATOM10_NS,
+              '  <id>urn:bridge:feed</id>\n  <title>bridge benchmark</title>\n',
+              '  <updated>2009-07-10T12:00:00Z</updated>\n']
+    for i in xrange(entries):
+        chunks.append("""  <entry>
+    <id>urn:bridge:entry:%(i)d</id>
+    <title type="text">Entry %(i)d &amp; friends</title>
+    <updated>2009-07-10T12:00:00Z</updated>
+    <published>2009-07-10T12:00:00Z</published>
+    <author><name>Sylvain</name><uri>http://www.defuze.org/</uri></author>
+    <link rel="alternate" type="text/html" href="http://www.defuze.org/%(i)d" />
+    <category term="python" />
+    <thr:in-reply-to ref="urn:bridge:entry:0" />
+    <!-- entry %(i)d -->
+    <content type="text">Lorem ipsum dolor sit amet, consectetur adipiscing elit.</content>
+  </entry>
+""" % {'i': i})
+    chunks.append('</feed>\n')
+    return ''.join(chunks)
+
+def timeit(func, repeat=3):
+    best = None
+    for i in xrange(repeat):
+        start = time.time()
+        func()
+        duration = time.time() - start
+        if best is None or duration < best:
+            best = duration
+    return best
+
+def memory_usage():
+    """
+    Resident memory of the process in bytes (Linux only).
+    """
+    import os
+    import resource
+    f = open('/proc/self/statm')
+    try:
+        return int(f.read().split()[1]) * resource.getpagesize()
+    finally:
+        f.close()
+
+def report(label, duration, reference=None):
+    if reference:
+        print "  %-40s %8.4fs  (x%.1f)" % (label, duration, reference / duration)
+    else:
+        print "  %-40s %8.4fs" % (label, duration)
+
+def bench_snapshot(entries=2000):
+    import cPickle
+    from bridge import snapshot
+
+    print "Reloading a %d entries feed" % entries
+    source = make_feed(entries)
+    doc = Element.load(source)
+    pickled = cPickle.dumps(doc, 2)
+    snap = snapshot.dumps(doc)
+
+    print "  XML: %d bytes, pickle: %d bytes, snapshot: %d bytes" % (len(source), len(pickled), len(snap))
+    reference = timeit(lambda: Element.load(source))
+    report('Element.load', reference)
+    report('cPickle.loads', timeit(lambda: cPickle.loads(pickled)), reference)
+    report('snapshot.loads', timeit(lambda: snapshot.loads(snap)), reference)
+    report('snapshot.dumps', timeit(lambda: snapshot.dumps(doc)))
+
+    assert snapshot.loads(snap).xml() == doc.xml()
+
+def bench_lazy(entries=20000):
+    import os
+    import tempfile
+
+    print "Time to first entry of a %d entries feed" % entries
+    fd, path = tempfile.mkstemp(suffix='.xml')
+    os.write(fd, make_feed(entries))
+    os.close(fd)
+    print "  %d bytes (raise `entries` to get closer to real archives)" % os.path.getsize(path)
+
+    def first_entry(lazy):
+        feed = Element.load(path, lazy=lazy).xml_root
+        return feed.get_child('entry', ATOM10_NS).get_child('id', ATOM10_NS).xml_text
+
+    try:
+        reference = timeit(lambda: first_entry(False), repeat=1)
+        report('Element.load', reference)
+        report('Element.load(lazy=True)', timeit(lambda: first_entry(True), repeat=1), reference)
+        assert Element.load(path, lazy=True).xml() == Element.load(path).xml()
+    finally:
+        os.unlink(path)
+
+def bench_parallel(entries=5000):
+    import multiprocessing
+
+    print "Parsing a %d entries feed across processes" % entries
+    source = make_feed(entries)
+    expected = Element.load(source).xml()
+
+    reference = timeit(lambda: Element.load(source), repeat=1)
+    report('Element.load', reference)
+    for processes in xrange(1, multiprocessing.cpu_count() + 1):
+        assert Element.load(source, processes=processes).xml() == expected
+        report('Element.load(processes=%d)' % processes,
+               timeit(lambda: Element.load(source, processes=processes), repeat=1), reference)
+
+XMPP_SESSION = ['<stream:stream xmlns="jabber:client" xmlns:stream="http://etherx.jabber.org/streams">',
+                 '<presence from="a@b/c"><status>away</status></presence>',
+                 '<message to="a@b" type="chat"><body>hello</body></message>',
+                 '<iq type="get" id="1"><query xmlns="jabber:iq:roster"/></iq>',
+                 '</stream:stream>']
+
+def bench_pool(sessions=5000):
+    from bridge.parser.bridge_default import DispatchParser, ParserPool
+    from bridge.common import XMPP_CLIENT_NS
+
+    def dispatch(element):
+        pass
+
+    print "Churn of %d XMPP sessions" % sessions
+    def without_pool():
+        for i in xrange(sessions):
+            parser = DispatchParser()
+            parser.register_on_element('message', dispatch, namespace=XMPP_CLIENT_NS)
+            parser.register_on_element('presence', dispatch, namespace=XMPP_CLIENT_NS)
+            parser.register_on_element('iq', dispatch, namespace=XMPP_CLIENT_NS)
+            for chunk in XMPP_SESSION:
+                parser.feed(chunk)
+            parser.reset()
+
+    pool = ParserPool()
+    pool.register_on_element('message', dispatch, namespace=XMPP_CLIENT_NS)
+    pool.register_on_element('presence', dispatch, namespace=XMPP_CLIENT_NS)
+    pool.register_on_element('iq', dispatch, namespace=XMPP_CLIENT_NS)
+    def with_pool():
+        for i in xrange(sessions):
+            parser = pool.acquire()
+            for chunk in XMPP_SESSION:
+                parser.feed(chunk)
+            pool.release(parser)
+
+    reference = timeit(without_pool)
+    report('DispatchParser per session', reference)
+    report('ParserPool', timeit(with_pool), reference)
+
+def bench_handler(parsers=10000, entries=2000):
+    import gc
+    from bridge.parser.bridge_default import IncrementalParser, DispatchParser
+
+    print "Memory held by %d idle parsers" % parsers
+    for parser_class in (IncrementalParser, DispatchParser):
+        gc.collect()
+        before = memory_usage()
+        kept = [parser_class() for i in xrange(parsers)]
+        gc.collect()
+        print "  %-40s %8d bytes per parser" % (parser_class.__name__, (memory_usage() - before) // parsers)
+        del kept
+
+    source = make_feed(entries)
+    def feed():
+        parser = IncrementalParser()
+        parser.feed(source)
+    print "Feeding a %d entries feed" % entries
+    duration = timeit(feed)
+    report('IncrementalParser.feed', duration)
+    print "  %-40s %8.2fus per element" % ('', duration * 1000000 / (entries * 13 + 4))
+
+def bench_batch(entries=5000):
+    import os
+    import sqlite3
+    import tempfile
+    from bridge.parser.bridge_default import DispatchParser
+
+    print "Storing the %d entries of a feed into SQLite, one transaction per dispatch" % entries
+    source = make_feed(entries)
+    chunks = [source[i:i + 8192] for i in xrange(0, len(source), 8192)]
+    directory = tempfile.mkdtemp()
+
+    def row(entry):
+        return (entry.get_child('id', ATOM10_NS).xml_text,
+                entry.get_child('title', ATOM10_NS).xml_text)
+
+    def store(register):
+        path = os.path.join(directory, 'entries.db')
+        db = sqlite3.connect(path)
+        db.execute('CREATE TABLE entry (id TEXT, title TEXT)')
+        def per_entry(entry):
+            db.execute('INSERT INTO entry VALUES (?, ?)', row(entry))
+            db.commit()
+        def per_batch(batch):
+            db.executemany('INSERT INTO entry VALUES (?, ?)', [row(entry) for entry in batch])
+            db.commit()
+        parser = DispatchParser()
+        register(parser, per_entry, per_batch)
+        for chunk in chunks:
+            parser.feed(chunk)
+        parser.close()
+        assert db.execute('SELECT COUNT(*) FROM entry').fetchone()[0] == entries
+        db.close()
+        os.unlink(path)
+        return parser
+
+    try:
+        reference = timeit(lambda: store(lambda p, entry, batch: p.register_on_element('entry', entry, namespace=ATOM10_NS)), repeat=1)
+        report('register_on_element', reference)
+        for size in (100, 1000):
+            report('register_batch_on_element(size=%d)' % size,
+                   timeit(lambda: store(lambda p, entry, batch: p.register_batch_on_element('entry', batch, namespace=ATOM10_NS, size=size)), repeat=1),
+                   reference)
+        parser = store(lambda p, entry, batch: p.register_batch_on_element('entry', batch, namespace=ATOM10_NS))
+        print "  %d entries left in the tree once batched" % len(list(parser.handler.doc().xml_root.get_children('entry', ATOM10_NS)))
+    finally:
+        os.rmdir(directory)
+
+def bench_offload(entries=1000, latency=0.002):
+    from bridge.parser.bridge_default import DispatchParser
+
+    print "Dispatching the %d entries of a feed to a %dms dispatcher" % (entries, latency * 1000)
+    source = make_feed(entries)
+    chunks = [source[i:i + 8192] for i in xrange(0, len(source), 8192)]
+
+    def dispatch(entry):
+        time.sleep(latency)
+
+    def parse(**offload):
+        parser = DispatchParser()
+        parser.register_on_element('entry', dispatch, namespace=ATOM10_NS)
+        executor = offload and parser.offload(**offload)
+        for chunk in chunks:
+            parser.feed(chunk)
+        parser.close()
+        if executor:
+            executor.shutdown()
+
+    reference = timeit(parse, repeat=1)
+    report('inline', reference)
+    for workers in (4, 16):
+        report('offload(workers=%d)' % workers,
+               timeit(lambda: parse(workers=workers, ordered=False), repeat=1), reference)
+        report('offload(workers=%d, key=entry id)' % workers,
+               timeit(lambda: parse(workers=workers, key=lambda e: e.get_child('id', ATOM10_NS).xml_text), repeat=1),
+               reference)
+
+def bench_projection(stanzas=20000):
+    import gc
+    from bridge.parser.bridge_default import DispatchParser
+    from bridge.common import XMPP_CLIENT_NS
+
+    print "Dispatching the messages of a %d stanzas XMPP stream" % stanzas
+    chunks = [XMPP_SESSION[0]]
+    for i in xrange(stanzas // 4):
+        chunks.extend(XMPP_SESSION[1:-1])
+        chunks.append('<iq type="result" id="%d"><query xmlns="jabber:iq:roster">%s</query></iq>' % \
+                      (i, ''.join(['<item jid="contact%d@b" name="Contact %d" subscription="both"><group>Friends</group></item>' % (j, j)
+                                   for j in xrange(10)])))
+    chunks.append(XMPP_SESSION[-1])
+
+    def parse(project):
+        messages = []
+        parser = DispatchParser()
+        parser.register_on_element('message', messages.append, namespace=XMPP_CLIENT_NS)
+        if project:
+            parser.project()
+        for chunk in chunks:
+            parser.feed(chunk)
+        assert len(messages) == stanzas // 4
+        return parser
+
+    reference = timeit(lambda: parse(False))
+    report('DispatchParser', reference)
+    report('DispatchParser.project()', timeit(lambda: parse(True)), reference)
+    for project in (False, True):
+        gc.collect()
+        before = memory_usage()
+        parser = parse(project)
+        gc.collect()
+        print "  %-40s %8d KB held by the tree" % (project and 'projected' or 'not projected', (memory_usage() - before) // 1024)
+        del parser
+
+def bench_stream_lookup(entries=5000):
+    import os
+    import tempfile
+    from bridge.filter import lookup, stream_lookup
+
+    print "Looking up the title and first entry id of a %d entries feed" % entries
+    fd, path = tempfile.mkstemp(suffix='.xml')
+    os.write(fd, make_feed(entries))
+    os.close(fd)
+
+    paths = [u'/{%(ns)s}feed/{%(ns)s}title' % {'ns': ATOM10_NS},
+             u'/{%(ns)s}feed/{%(ns)s}entry/{%(ns)s}id' % {'ns': ATOM10_NS}]
+    try:
+        for query in paths:
+            expected = Element.load(path).filtrate(lookup, path=query).xml_text
+            assert stream_lookup(path, query).xml_text == expected
+            reference = timeit(lambda: Element.load(path).filtrate(lookup, path=query), repeat=1)
+            report('Element.load + lookup', reference)
+            report('stream_lookup', timeit(lambda: stream_lookup(path, query)), reference)
+    finally:
+        os.unlink(path)
+
+def bench_strip(entries=5000):
+    import gc
+    from bridge.parser.bridge_default import IncrementalParser
+
+    print "Loading a pretty-printed %d entries feed" % entries
+    source = make_feed(entries)
+    options = dict(strip_comments=True, strip_pis=True, strip_whitespace=True)
+
+    def incremental(**options):
+        parser = IncrementalParser(**options)
+        parser.feed(source)
+        return parser.handler.doc()
+
+    for label, load in (('Element.load', lambda **options: Element.load(source, **options)),
+                        ('IncrementalParser', incremental)):
+        reference = timeit(lambda: load(), repeat=1)
+        report(label, reference)
+        report('%s(strip_*=True)' % label, timeit(lambda: load(**options), repeat=1), reference)
+        for stripped in (False, True):
+            gc.collect()
+            before = memory_usage()
+            document = stripped and load(**options) or load()
+            gc.collect()
+            print "  %-40s %8d KB" % (stripped and 'stripped' or 'not stripped', (memory_usage() - before) // 1024)
+            del document
+
+def bench_coalesce(size=1 << 20, chunk=64):
+    from bridge.parser.bridge_default import IncrementalParser
+
+    print "Feeding a %d bytes text body by chunks of %d bytes" % (size, chunk)
+    line = 'Lorem ipsum dolor sit amet &amp; consectetur adipiscing elit.\n'
+    source = '<doc><body>%s</body></doc>' % (line * (size // len(line)))
+    chunks = [source[i:i + chunk] for i in xrange(0, len(source), chunk)]
+
+    def feed():
+        parser = IncrementalParser()
+        for data in chunks:
+            parser.feed(data)
+        return parser.handler.doc()
+
+    body = feed().xml_root.xml_children[0]
+    print "  %-40s %8d" % ('strings held by the body', len(body.xml_children) + (body.xml_text is not None))
+    report('IncrementalParser.feed', timeit(feed))
+    report('Element.collapse', timeit(lambda: body.collapse()))
+    report('Element.xml', timeit(lambda: body.xml()))
+
+def bench_text(paragraphs=20000):
+    print "Loading and serializing a document of %d paragraphs" % paragraphs
+    chunks = ['<doc>']
+    for i in xrange(paragraphs):
+        if i % 10:
+            chunks.append('<p>Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor.</p>')
+        else:
+            chunks.append('<p>Ut enim ad minim veniam, quis nostrud &lt;exercitation&gt; ullamco &amp; laboris.</p>')
+    chunks.append('</doc>')
+    source = ''.join(chunks)
+
+    doc = Element.load(source)
+    report('Element.load', timeit(lambda: Element.load(source)))
+    report('Element.xml', timeit(lambda: doc.xml()))
+    assert Element.load(doc.xml()).xml() == doc.xml()
+
+def bench_intern(entries=5000):
+    import gc
+    from bridge.common import ATOM10_NS
+    from bridge.parser.bridge_default import IncrementalParser
+
+    print "Loading a %d entries feed" % entries
+    source = make_feed(entries)
+
+    def find_titles(root):
+        return [entry.get_child('title', ATOM10_NS) for entry in root.get_children('entry', ATOM10_NS)]
+
+    class Verbatim(dict):
+        # looks like a names table but interns nothing
+        def __missing__(self, key):
+            return key
+
+    def incremental(interned=True):
+        parser = IncrementalParser()
+        if not interned:
+            parser.handler.names = Verbatim()
+        parser.feed(source)
+        return parser.handler.doc()
+
+    for label, load in (('Element.load', lambda: Element.load(source)),
+                        ('IncrementalParser (not interned)', lambda: incremental(False)),
+                        ('IncrementalParser', incremental)):
+        gc.collect()
+        before = memory_usage()
+        document = load()
+        gc.collect()
+        print "  %-40s %8d KB" % (label, (memory_usage() - before) // 1024)
+        report('%s get_child' % label, timeit(lambda: find_titles(document.xml_root)))
+        document = None
+
+def bench_c14n(entries=100000):
+    import hashlib
+    from bridge import c14n
+    from bridge.parser.bridge_default import DispatchParser
+
+    print "Hashing the canonical form of the %d entries of a feed" % entries
+    source = make_feed(entries)
+    chunks = [source[i:i + 65536] for i in xrange(0, len(source), 65536)]
+    canonicalizer = c14n.Canonicalizer(exclusive=True)
+
+    def parse(hash_entry=None):
+        def dispatch(entry):
+            if hash_entry:
+                hash_entry(entry)
+            entry.xml_parent.xml_children.remove(entry)
+        parser = DispatchParser(strip_whitespace=True)
+        parser.register_on_element('entry', dispatch, namespace=ATOM10_NS)
+        for chunk in chunks:
+            parser.feed(chunk)
+        parser.close()
+
+    def streamed(entry):
+        canonicalizer.write(entry, hashlib.sha1())
+
+    def materialized(entry):
+        hashlib.sha1(c14n.dumps(entry, exclusive=True)).hexdigest()
+
+    parsing = timeit(parse, repeat=1)
+    report('parsing only', parsing)
+    for label, hash_entry in (('sha1(c14n.dumps(entry))', materialized),
+                              ('Canonicalizer.write(entry, sha1)', streamed)):
+        duration = timeit(lambda: parse(hash_entry), repeat=1)
+        report(label, duration)
+        print "  %-40s %8d entries/s" % ('  hashing throughput', entries / (duration - parsing))
+
+def bench_dedupe(feeds=4, entries=2000):
+    import gc
+    from bridge.filter import content_hash, dedupe_subtrees
+    from bridge.parser.bridge_default import IncrementalParser
+
+    print "Keeping %d feeds of %d entries in memory" % (feeds, entries)
+    source = make_feed(entries)
+
+    def load():
+        parser = IncrementalParser()
+        parser.feed(source)
+        return parser.handler.doc()
+
+    document = load()
+    report('content_hash', timeit(lambda: content_hash(document), repeat=1))
+    cache = {}
+    content_hash(document, cache)
+    report('dedupe_subtrees', timeit(lambda: dedupe_subtrees(load(), {}), repeat=1))
+    entries = list(document.xml_root.get_children('entry', ATOM10_NS))
+    report('compare %d authors' % len(entries),
+           timeit(lambda: [cache[id(entry.get_child('author', ATOM10_NS))] == cache[id(entries[0].get_child('author', ATOM10_NS))]
+                           for entry in entries]))
+    cache = entries = document = None
+
+    for dedupe in (True, False):
+        gc.collect()
+        before = memory_usage()
+        documents = []
+        for i in xrange(feeds):
+            documents.append(load())
+            if dedupe:
+                dedupe_subtrees(documents[-1])
+            gc.collect()
+        print "  %-40s %8d KB" % (dedupe and 'deduplicated' or 'not deduplicated', (memory_usage() - before) // 1024)
+        documents = None
+
+def bench_diff(entries=5000, changes=50):
+    import cPickle
+    from bridge import diff, patch, snapshot
+    from bridge.parser.bridge_default import IncrementalParser
+
+    source = make_feed(entries)
+    parser = IncrementalParser()
+    parser.feed(source)
+    old = parser.handler.doc()
+    data = snapshot.dumps(old)
+    nodes = source.count('<')
+    print "Diffing two versions of a %d entries feed (~%d nodes), %d changes of each kind" % (entries, nodes, changes)
+
+    new = snapshot.loads(data)
+    root = new.xml_root
+    feed_entries = list(root.get_children('entry', ATOM10_NS))
+    step = len(feed_entries) // changes
+    for i, entry in enumerate(feed_entries[::step][:changes]):
+        entry.get_child('title', ATOM10_NS).xml_text = u'Updated entry %d' % i
+    for entry in feed_entries[step // 2::step][:changes]:
+        root.xml_children.remove(entry)
+    for entry in feed_entries[step // 3::step][:changes]:
+        root.xml_children.remove(entry)
+        root.xml_children.insert(4, entry)
+    for i in xrange(changes):
+        entry = snapshot.loads(snapshot.dumps(feed_entries[0]))
+        entry.get_child('id', ATOM10_NS).xml_text = u'urn:bridge:new:%d' % i
+        entry.xml_parent = root
+        root.xml_children.insert(len(root.xml_children) // 2, entry)
+
+    script = diff(old, new)
+    report('diff', timeit(lambda: diff(old, new), repeat=1))
+    target = snapshot.loads(data)
+    report('patch', timeit(lambda: patch(target, script), repeat=1))
+    print "  %-40s %8d operations, %d bytes (document: %d bytes)" % ('script', len(script),
+                                                                   len(cPickle.dumps(script, 2)), len(new.xml()))
+    assert target.xml() == new.xml()
+
+def bench_walk(depth=10000, width=1000000):
+    from bridge.common import XMPP_CLIENT_NS
+    from bridge.filter import remove_duplicate_namespaces_declaration
+    from bridge.filter.xmpp import lookup_first_error
+
+    def run(label, func):
+        try:
+            report(label, timeit(func, repeat=1))
+        except RuntimeError, e:
+            print "  %-40s %s" % (label, e)
+
+    deep = Element(u'message', namespace=XMPP_CLIENT_NS)
+    element = deep
+    for i in xrange(depth):
+        element = Element(u'body', u'text', namespace=XMPP_CLIENT_NS, parent=element)
+    Element(u'error', namespace=XMPP_CLIENT_NS, parent=element)
+
+    wide = Element(u'message', namespace=XMPP_CLIENT_NS)
+    for i in xrange(width):
+        Element(u'body', u'text', namespace=XMPP_CLIENT_NS, parent=wide)
+    Element(u'error', namespace=XMPP_CLIENT_NS, parent=wide)
+
+    for label, root in (('%d deep' % depth, deep), ('%d wide' % width, wide)):
+        print "Walking a tree %s" % label
+        run('xml', lambda: root.xml())
+        run('collapse', lambda: root.collapse())
+        run('update_prefix', lambda: root.update_prefix(u'c', XMPP_CLIENT_NS, XMPP_CLIENT_NS))
+        run('remove_duplicate_namespaces_declaration', lambda: remove_duplicate_namespaces_declaration(root))
+        run('lookup_first_error', lambda: lookup_first_error(root))
+
+def bench_collapse(sections=2000, depth=20):
+    from bridge.common import XHTML1_NS
+
+    print "Collapsing an XHTML body of %d sections %d levels deep" % (sections, depth)
+    chunks = ['<html xmlns="%s"><body>' % XHTML1_NS]
+    for i in xrange(sections):
+        chunks.append('<div><p>Section %d <em>lorem</em> ipsum' % i * depth)
+        chunks.append('</p></div>' * depth)
+    chunks.append('</body></html>')
+    body = Element.load(''.join(chunks)).xml_root.get_child('body', XHTML1_NS)
+
+    def nested_collapse(element, separator='\n'):
+        text = [element.xml_text or '']
+        for child in element.xml_children:
+            if isinstance(child, basestring):
+                text.append(child)
+            elif isinstance(child, Element):
+                text.append(nested_collapse(child, separator))
+        return separator.join(text)
+
+    class Sink(object):
+        size = 0
+        def write(self, data):
+            self.size += len(data)
+
+    reference = timeit(lambda: nested_collapse(body))
+    report('join at every level', reference)
+    report('collapse', timeit(lambda: body.collapse()), reference)
+    report('collapse(out=stream)', timeit(lambda: body.collapse(out=Sink())), reference)
+    report('itertext', timeit(lambda: sum(len(text) for text in body.itertext())), reference)
+    assert nested_collapse(body) == body.collapse()
+
+def bench_pipeline(entries=5000):
+    from bridge.filter import Pipeline
+    from bridge.filter.atom import requires_summary, requires_author, lookup_links, \
+         lookup_entry, valid_categories, fetch_empty_authors
+
+    print "Applying six Atom filters to a %d entries feed" % entries
+    document = Element.load(make_feed(entries))
+    category = Element(u'category', namespace=ATOM10_NS, attributes={u'term': u'python'})
+    filters = [(requires_summary, {}), (requires_author, {}),
+               (lookup_links, {'rel': u'alternate'}), (lookup_entry, {'id': u'urn:bridge:entry:42'}),
+               (valid_categories, {'test_set': [category]}), (fetch_empty_authors, {})]
+
+    def separately():
+        results = []
+        for some_filter, kwargs in filters:
+            results.extend(Pipeline().add(some_filter, **kwargs).run(document))
+        return results
+
+    def fused():
+        pipeline = Pipeline()
+        for some_filter, kwargs in filters:
+            pipeline.add(some_filter, **kwargs)
+        return pipeline.run(document)
+
+    reference = timeit(separately)
+    report('one traversal per filter', reference)
+    report('fused', timeit(fused), reference)
+    assert separately() == fused()
+
+def bench_binding(entries=5000, reads=10):
+    from bridge.binding import atom
+
+    print "Reading the rel, type and href of the links of %d entries %d times" % (entries, reads)
+    source = make_feed(entries)
+
+    def scans(feed):
+        links = [entry.get_child('link', ATOM10_NS) for entry in feed.get_children('entry', ATOM10_NS)]
+        for i in xrange(reads):
+            for link in links:
+                link.get_attribute_value('rel')
+                link.get_attribute_value('type')
+                link.get_attribute_value('href')
+
+    def accessors(feed):
+        links = [entry.link[0] for entry in feed.entry]
+        for i in xrange(reads):
+            for link in links:
+                link.rel
+                link.type
+                link.href
+
+    atom.register()
+    try:
+        bound = Element.load(source).xml_root
+        bound_load = timeit(lambda: Element.load(source), repeat=1)
+    finally:
+        atom.unregister()
+    plain = Element.load(source).xml_root
+    reference = timeit(lambda: Element.load(source), repeat=1)
+    report('Element.load', reference)
+    report('Element.load (bound classes)', bound_load, reference)
+
+    reference = timeit(lambda: scans(plain))
+    report('get_attribute_value', reference)
+    report('bound accessors', timeit(lambda: accessors(bound)), reference)
+
+def bench_getattr(entries=5000, reads=10):
+    print "Reading the entries of a feed of %d entries and their id, title and updated %d times" % (entries, reads)
+    feed = Element.load(make_feed(entries)).xml_root
+
+    def scans():
+        for i in xrange(reads):
+            for entry in feed.get_children('entry', ATOM10_NS):
+                entry.get_child('id', ATOM10_NS).xml_text
+                entry.get_child('title', ATOM10_NS).xml_text
+                entry.get_child('updated', ATOM10_NS).xml_text
+
+    def attributes():
+        for i in xrange(reads):
+            for entry in feed.entry:
+                entry.id.xml_text
+                entry.title.xml_text
+                entry.updated.xml_text
+
+    reference = timeit(scans)
+    report('get_children/get_child', reference)
+    report('attribute access', timeit(attributes), reference)
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or sorted(name[6:] for name in globals() if name.startswith('bench_'))
+    for name in names:
+        globals()['bench_%s' % name]()
@@ -4,6 +4,9 @@ from test_default import TestDefault
 from test_amara import TestAmara
 from test_lxml import TestLXML
 from test_elementtree import TestElementTree
+from test_loading import TestLoading
+from test_parser import TestParser
+from test_delta import TestDelta
 
 if __name__ == '__main__':
     suite = unittest.TestSuite()
@@ -11,4 +14,7 @@ if __name__ == '__main__':
     suite.addTest(unittest.makeSuite(TestAmara))
     suite.addTest(unittest.makeSuite(TestLXML))
     suite.addTest(unittest.makeSuite(TestElementTree))
+    suite.addTest(unittest.makeSuite(TestLoading))
+    suite.addTest(unittest.makeSuite(TestParser))
+    suite.addTest(unittest.makeSuite(TestDelta))
     unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+import cPickle
+import unittest
+
+from bridge import Element, Comment, PI, diff, patch
+
+class TestDelta(unittest.TestCase):
+    """
+    Edit scripts computed by diff and applied by patch.
+    """
+    def test_comments_and_pis_are_not_shared(self):
+        old = Element.load('<r><a/></r>')
+        other = Element.load('<r><a/></r>')
+        new = Element.load('<r><!--c--><a/><?p d?></r>')
+        expected = new.xml()
+        script = diff(old, new)
+
+        for operation in script:
+            if isinstance(operation[-1], (Comment, PI)):
+                self.failUnless(operation[-1].xml_parent is None)
+
+        patch(old, script)
+        patch(other, cPickle.loads(cPickle.dumps(script, 2)))
+        self.assertEqual(old.xml(), expected)
+        self.assertEqual(other.xml(), expected)
+        self.assertEqual(new.xml(), expected)
+
+        root = new.xml_root
+        for child in root.xml_children:
+            self.failUnless(child.xml_parent is root)
+        for child in old.xml_root.xml_children:
+            self.failUnless(child.xml_parent is old.xml_root)
+        self.failIf(old.xml_root.xml_children[0] is root.xml_children[0])
+
+if __name__ == '__main__':
+    unittest.main()
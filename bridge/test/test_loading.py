@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+import itertools
+import os
+import tempfile
+import time
+import unittest
+from xml.parsers.expat import ExpatError
+
+from bridge import Element, load_many
+
+class BrokenFile(object):
+    def read(self, *args):
+        raise IOError('broken')
+
+DOCUMENTS = {
+    'mixed text': '<r>a<b>1</b>c<d/>e<f>2<g/>3</f>h</r>',
+    'self-closing siblings': '<r><a/><b x="1"/><c></c><d/></r>',
+    'nested': '<r><a><b><c>deep</c></b></a><a><b/></a></r>',
+    'attributes and namespaces': '<r xmlns="urn:r" xmlns:x="urn:x" x:a="1">'
+                                 '<x:s x:b="2"><t/></x:s><u xmlns="urn:u">v</u></r>',
+    'comments and pis': '<r><!-- c --><a/><?pi data?><b><!-- d --></b></r>',
+    'cdata': '<r><a><![CDATA[<not> & markup]]></a><b>t</b></r>',
+    'doctype entities': '<?xml version="1.0"?>\n<!DOCTYPE r [<!ENTITY foo "bar">\n'
+                        '<!ENTITY tag "<i>x</i>">]>\n<r><a>&foo;</a><b c="&foo;">&tag;</b></r>',
+    'latin-1': u'<?xml version="1.0" encoding="ISO-8859-1"?>\n'
+               u'<r><a>caf\xe9</a><b \xe9="\xe8">na\xefve</b></r>'.encode('iso-8859-1'),
+    'utf-16': u'<?xml version="1.0" encoding="UTF-16"?>'
+              u'<r><a>日本</a><b/></r>'.encode('utf-16'),
+    'root only': '<r>text</r>',
+}
+
+class TestLoading(unittest.TestCase):
+    """
+    Lazy and parallel loading build the same tree as eager loading.
+    """
+    def setUp(self):
+        self.paths = []
+
+    def tearDown(self):
+        for path in self.paths:
+            os.unlink(path)
+
+    def write(self, data):
+        fd, path = tempfile.mkstemp(suffix='.xml')
+        os.write(fd, data)
+        os.close(fd)
+        self.paths.append(path)
+        return path
+
+    def assertLoadsAlike(self, name, source, **options):
+        expected = Element.load(source, **options).xml()
+        self.assertEqual(Element.load(source, lazy=True, **options).xml(), expected,
+                         '%s: lazy' % name)
+        self.assertEqual(Element.load(source, processes=2, **options).xml(), expected,
+                         '%s: parallel' % name)
+
+    def test_strings(self):
+        for name, data in DOCUMENTS.iteritems():
+            if name != 'utf-16':
+                self.assertLoadsAlike(name, data)
+
+    def test_files(self):
+        for name, data in DOCUMENTS.iteritems():
+            self.assertLoadsAlike(name, self.write(data))
+
+    def test_strip_options(self):
+        for name, data in DOCUMENTS.iteritems():
+            self.assertLoadsAlike(name, self.write(data), strip_comments=True,
+                                  strip_pis=True, strip_whitespace=True)
+
+    def test_lazy_children_are_loaded_on_access(self):
+        feed = Element.load(DOCUMENTS['doctype entities'], lazy=True).xml_root
+        a = feed.xml_children[0]
+        self.failIf(a.is_materialized())
+        self.assertEqual(a.xml_text, u'bar')
+        self.failUnless(a.is_materialized())
+
+    def test_empty_input(self):
+        path = self.write('')
+        for source in ('', path):
+            for options in ({}, {'lazy': True}, {'processes': 2}):
+                self.assertRaises(ExpatError, Element.load, source, **options)
+
+    def test_load_many(self):
+        sources = [DOCUMENTS['nested'], '<r>', DOCUMENTS['root only']]
+        for executor in ('process', 'thread'):
+            results = list(load_many(sources, workers=2, executor=executor))
+            self.assertEqual([source for source, doc, error in results], sources)
+            self.assertEqual(results[0][1].xml(), Element.load(sources[0]).xml())
+            self.failIf(results[1][1])
+            self.failUnless(results[1][2])
+            self.assertEqual(results[2][1].xml_root.xml_text, u'text')
+
+    def test_load_many_read_error(self):
+        broken = BrokenFile()
+        for executor in ('process', 'thread'):
+            results = list(load_many([broken, DOCUMENTS['root only']],
+                                     workers=2, executor=executor))
+            self.assertEqual(len(results), 2)
+            source, doc, error = results[0]
+            self.failUnless(source is broken)
+            self.failUnless(doc is None)
+            self.failUnless('broken' in str(error))
+            self.failUnless(results[1][2] is None)
+
+    def test_load_many_endless_sources(self):
+        for executor in ('process', 'thread'):
+            sources = itertools.repeat(DOCUMENTS['root only'])
+            results = load_many(sources, workers=2, executor=executor, chunksize=2)
+            for i, (source, doc, error) in enumerate(results):
+                self.assertEqual(doc.xml_root.xml_text, u'text')
+                if i == 10:
+                    break
+            started = time.time()
+            results.close()
+            self.failUnless(time.time() - started < 5)
+
+if __name__ == '__main__':
+    unittest.main()
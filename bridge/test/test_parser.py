@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from bridge import Element
+from bridge.parser import StanzaReader, IncrementalParser
+from bridge.parser.bridge_default import ParserPool, DispatchTable, ANY_NAMESPACE
+
+STREAM = '<stream:stream xmlns="jabber:client" xmlns:stream="http://etherx.jabber.org/streams">'
+
+class TestParser(unittest.TestCase):
+    """
+    Stream readers, parser pools and dispatch tables.
+    """
+    def test_stanza_reader_drops_whitespace_between_stanzas(self):
+        reader = StanzaReader()
+        reader.feed(STREAM + '\n  ')
+        for i in range(10):
+            reader.feed('<message><body> hi </body></message>\n  <presence/>\n  ')
+        stanzas = list(reader)
+        self.assertEqual(len(stanzas), 20)
+        self.assertEqual(stanzas[0].xml_children[0].xml_text, u' hi ')
+        self.failIf(reader.root.xml_text)
+        self.assertEqual(reader.root.xml_children, [])
+
+    def test_pool_release_twice(self):
+        pool = ParserPool()
+        parser = pool.acquire()
+        parser.feed('<r><a/>')
+        pool.release(parser)
+        pool.release(parser)
+        self.assertEqual(len(pool.idle), 1)
+        self.failUnless(pool.acquire() is parser)
+        self.failIf(pool.acquire() is parser)
+
+    def test_dispatch_table_cache_is_bounded(self):
+        def dispatcher(element):
+            pass
+        table = DispatchTable()
+        table.add((ANY_NAMESPACE, u'message'), dispatcher)
+        for i in range(table.max_resolved * 3):
+            self.assertEqual(table.lookup(u'urn:x', u'name%d' % i), ())
+        self.failUnless(len(table._resolved) <= table.max_resolved)
+        self.assertEqual(table.lookup(u'urn:x', u'message'), (dispatcher,))
+
+    def test_text_placement_after_stripping(self):
+        options = dict(strip_comments=True, strip_pis=True, strip_whitespace=True)
+        for data in ('<a><!--c-->text</a>', '<a><?p x?>text<!--c--></a>',
+                     '<a> <b>text</b> </a>', '<a><!--c--><b/>text</a>'):
+            parser = IncrementalParser(**options)
+            parser.feed(data)
+            incremental = parser.handler.doc().xml_root
+            eager = Element.load(data, **options).xml_root
+            self.assertEqual(eager.xml_text, incremental.xml_text, data)
+            self.assertEqual(len(eager.xml_children), len(incremental.xml_children), data)
+        a = Element.load('<a><!--c-->text</a>', strip_comments=True).xml_root
+        self.assertEqual(a.xml_text, u'text')
+        self.assertEqual(a.xml_children, [])
+
+if __name__ == '__main__':
+    unittest.main()
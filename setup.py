@@ -17,7 +17,7 @@ setup(name = "bridge",
       url = "http://trac.defuze.org/wiki/bridge",
       download_url = "http://www.defuze.org/oss/bridge/",
       packages = ["bridge", "bridge.parser", "bridge.lib",
-                  "bridge.filter", "bridge.validator"],
+                  "bridge.filter", "bridge.validator", "bridge.binding"],
       platforms = ["any"],
       license = 'BSD',
       long_description = "",